@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from .models import SlowQuery
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('created', 'duration', 'view', 'origin', 'database')
+    search_fields = ('sql', 'view', 'origin')
+    list_filter = ('view', 'database')
+    readonly_fields = (
+        'created', 'duration', 'database', 'view', 'origin', 'sql',
+        'params', 'plan',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(SlowQuery, SlowQueryAdmin)
@@ -0,0 +1,102 @@
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import exceptions
+
+
+class AsyncReadMixin:
+    """Асинхронные GET и HEAD для ViewSet.
+
+    Если у действия, которое маршрут отдает на GET, есть корутина
+    a<действие> (alist, aretrieve, asubscriptions), as_view возвращает
+    асинхронное представление: аутентификация (aauthenticate) и запросы
+    к базе идут через async ORM, а остальная работа DRF - разбор запроса,
+    права, выбор формата, сериализация готовых данных - не делает
+    ввода-вывода и выполняется как есть. Остальные методы того же адреса
+    обслуживает обычный синхронный ViewSet в потоке.
+    Выключается настройкой ASYNC_READ_VIEWS.
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if (
+            not settings.ASYNC_READ_VIEWS
+            or not hasattr(cls, f'a{actions.get("get")}')
+        ):
+            return view
+        sync_view = sync_to_async(view)
+        read_actions = {'head': actions['get'], **actions}
+
+        async def async_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = read_actions
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.async_dispatch(request, *args, **kwargs)
+
+        return update_wrapper(async_view, view)
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        """APIView.dispatch для обработчика-корутины."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await self.aperform_authentication(request)
+            self.initial(request, *args, **kwargs)
+            handler = getattr(self, f'a{self.action}')
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs
+        )
+        return self.response
+
+    async def aperform_authentication(self, request):
+        """Request._authenticate с aauthenticate аутентификаторов."""
+        for authenticator in request.authenticators:
+            authenticate = getattr(authenticator, 'aauthenticate', None)
+            if authenticate is None:
+                authenticate = sync_to_async(authenticator.authenticate)
+            try:
+                user_auth_tuple = await authenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (
+            queryset.model.DoesNotExist, TypeError, ValueError,
+            ValidationError,
+        ):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(
+            queryset, self.request, view=self
+        )
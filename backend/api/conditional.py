@@ -0,0 +1,114 @@
+import hashlib
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from recipes.models import CatalogueVersion
+
+
+def _skip(request, anonymous_only):
+    return anonymous_only and request.user.is_authenticated
+
+
+def _get_versions(request, sections, anonymous_only):
+    if _skip(request, anonymous_only):
+        return None
+    if not hasattr(request, '_catalogue_versions'):
+        request._catalogue_versions = {
+            item.name: item
+            for item in CatalogueVersion.objects.filter(name__in=sections)
+        }
+    return [request._catalogue_versions.get(name) for name in sections]
+
+
+async def _aload_versions(request, sections, anonymous_only):
+    if _skip(request, anonymous_only):
+        return
+    if not hasattr(request, '_catalogue_versions'):
+        request._catalogue_versions = {
+            item.name: item
+            async for item in CatalogueVersion.objects.filter(
+                name__in=sections
+            )
+        }
+
+
+def get_catalogue_version(request, name):
+    """Версия раздела, из которой построен ETag запроса, или None."""
+    item = getattr(request, '_catalogue_versions', {}).get(name)
+    return item.version if item else None
+
+
+def catalogue_condition(*sections, anonymous_only=False):
+    """Условный GET (ETag, Last-Modified, 304) по версиям разделов каталога.
+
+    ETag зависит от версий разделов, пути с параметрами и заголовка Accept.
+    С anonymous_only=True авторизованным пользователям отдается полный
+    ответ, так как в нем есть персональные поля.
+    Подходит и для асинхронных обработчиков: версии тогда читаются через
+    async ORM.
+    """
+
+    def etag_func(request, *args, **kwargs):
+        versions = _get_versions(request, sections, anonymous_only)
+        if versions is None:
+            return None
+        key = ':'.join(
+            [str(item.version if item else 0) for item in versions]
+            + [request.get_full_path(), request.META.get('HTTP_ACCEPT', '')]
+        )
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        versions = _get_versions(request, sections, anonymous_only)
+        if not versions or None in versions:
+            return None
+        return max(item.updated for item in versions)
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            return _async_condition(
+                view_func, sections, anonymous_only, etag_func,
+                last_modified_func,
+            )
+
+        conditional_view = condition(etag_func, last_modified_func)(view_func)
+
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _async_condition(view_func, sections, anonymous_only, etag_func,
+                     last_modified_func):
+    """То же, что django.views.decorators.http.condition, для корутин."""
+
+    async def wrapper(request, *args, **kwargs):
+        await _aload_versions(request, sections, anonymous_only)
+        etag = etag_func(request)
+        etag = quote_etag(etag) if etag is not None else None
+        last_modified = last_modified_func(request)
+        last_modified = (
+            int(last_modified.timestamp()) if last_modified else None
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = await view_func(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    return wrapper
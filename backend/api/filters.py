@@ -1,12 +1,44 @@
-def recipe_queryset_fiter(queryset, request):
-    tags = request.query_params.getlist('tags')
-    author = request.query_params.get('author')
-    if tags:
-        queryset = queryset.filter(tags__slug__in=tags).distinct()
-    if request.query_params.get('is_in_shopping_cart'):
-        queryset = queryset.filter(is_in_shopping_cart=True)
-    if request.query_params.get('is_favorited'):
-        queryset = queryset.filter(is_favorited=True)
-    if author:
-        queryset = queryset.filter(author=author)
-    return queryset
+from django.db.models import Exists, OuterRef
+from rest_framework.filters import BaseFilterBackend
+
+from recipes.models import Favorites, Recipe, ShoppingCart
+from recipes.search import search_recipes
+
+from .serializers import RecipeFilterSerializer
+
+
+class RecipeFilterBackend(BaseFilterBackend):
+    """Фильтрует рецепты по параметрам из RecipeFilterSerializer.
+
+    Теги проверяются через EXISTS, поэтому не нужен distinct(), а избранное
+    и список покупок выбираются по индексу (user, recipe) своих таблиц.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = RecipeFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        user = request.user
+        if params.get('tags'):
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('id'),
+                    tag__slug__in=params['tags'],
+                )
+            ))
+        if params.get('author'):
+            queryset = queryset.filter(author_id=params['author'])
+        for flag, model in (
+            ('is_favorited', Favorites),
+            ('is_in_shopping_cart', ShoppingCart),
+        ):
+            if not params.get(flag):
+                continue
+            if not user.is_authenticated:
+                return queryset.none()
+            queryset = queryset.filter(
+                id__in=model.objects.filter(user=user).values('recipe_id')
+            )
+        if params.get('search'):
+            queryset = search_recipes(queryset, params['search'])
+        return queryset
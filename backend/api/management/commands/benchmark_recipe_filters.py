@@ -0,0 +1,91 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.filters import RecipeFilterBackend
+from recipes.models import Favorites, Recipe, Tag
+from users.models import User
+
+COMBINATIONS = (
+    'tags={tag}',
+    'tags={tag}&tags={other_tag}',
+    'is_favorited=1',
+    'is_in_shopping_cart=1',
+    'tags={tag}&is_favorited=1',
+    'author={author}&tags={tag}',
+)
+
+
+def legacy_recipe_filter(queryset, request):
+    """Фильтрация рецептов до RecipeFilterBackend: join по тегам + distinct."""
+    tags = request.query_params.getlist('tags')
+    author = request.query_params.get('author')
+    if tags:
+        queryset = queryset.filter(tags__slug__in=tags).distinct()
+    if request.query_params.get('is_in_shopping_cart'):
+        queryset = queryset.filter(is_in_shopping_cart=True)
+    if request.query_params.get('is_favorited'):
+        queryset = queryset.filter(is_favorited=True)
+    if author:
+        queryset = queryset.filter(author=author)
+    return queryset
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время фильтрации списка рецептов: прежний '
+            'join + distinct и RecipeFilterBackend на EXISTS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='id пользователя')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        user = self._get_user(options['user'])
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        author = Recipe.objects.values_list('author_id', flat=True).first()
+        if len(tags) < 2 or author is None:
+            raise CommandError('Нужны хотя бы два тега и один рецепт')
+        factory = APIRequestFactory()
+        backend = RecipeFilterBackend()
+        self.stdout.write(
+            f'{"параметры":45} {"было, мс":>10} {"стало, мс":>10}'
+        )
+        for combination in COMBINATIONS:
+            query = combination.format(
+                tag=tags[0], other_tag=tags[1], author=author
+            )
+            request = Request(factory.get(f'/api/recipes/?{query}'))
+            request.user = user
+            base = Recipe.objects.select_related('author').annotate_quryset(
+                user
+            )
+            legacy = self._measure(
+                lambda: legacy_recipe_filter(base, request), options
+            )
+            current = self._measure(
+                lambda: backend.filter_queryset(request, base, None), options
+            )
+            self.stdout.write(f'{query:45} {legacy:10.2f} {current:10.2f}')
+
+    def _get_user(self, user_id):
+        if user_id:
+            return User.objects.get(id=user_id)
+        favorite = Favorites.objects.select_related('user').first()
+        if favorite is None:
+            raise CommandError('Нет избранных рецептов, укажите --user')
+        return favorite.user
+
+    def _measure(self, build_queryset, options):
+        """Медиана времени COUNT(*) и выборки первой страницы, мс."""
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            queryset = build_queryset()
+            queryset.count()
+            list(queryset[:options['limit']])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.query_budget import QueryBudgetExceeded, query_budget
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from recipes.search import rebuild_search_index
+from users.authentication import token_cache
+from users.models import Subscription, User
+
+PAGE_SIZES = (1, 10, 50)
+
+
+class Command(BaseCommand):
+    help = ('Проверяет, что число SQL-запросов на эндпоинтах из '
+            'QUERY_BUDGETS при пустом кеше не превышает бюджет и не '
+            'зависит от размера страницы.')
+
+    # Запись медленных запросов добавила бы к счету лишние запросы
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            client, recipe = self._create_fixtures(max(PAGE_SIZES))
+            for url, limit in settings.QUERY_BUDGETS.items():
+                url = url.format(recipe_id=recipe.id)
+                failures += self._check(client, url, limit)
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError('\n\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Бюджеты запросов соблюдены'))
+
+    def _check(self, client, url, limit):
+        failures = []
+        counts = set()
+        for page_size in PAGE_SIZES:
+            separator = '&' if '?' in url else '?'
+            page_url = f'{url}{separator}limit={page_size}'
+            cache.clear()
+            token_cache.clear()
+            try:
+                with query_budget(limit, name=page_url) as context:
+                    response = client.get(page_url)
+            except QueryBudgetExceeded as error:
+                failures.append(str(error))
+                continue
+            if response.status_code != 200:
+                failures.append(f'{page_url}: статус {response.status_code}')
+            counts.add(len(context.captured_queries))
+            self.stdout.write(
+                f'{page_url}: {len(context.captured_queries)}/{limit}'
+            )
+        if len(counts) > 1:
+            failures.append(
+                f'{url}: число запросов зависит от размера страницы {counts}'
+            )
+        return failures
+
+    def _create_fixtures(self, count):
+        tags = list(Tag.objects.all()[:2])
+        ingredients = list(Ingredient.objects.all()[:3])
+        if not tags or not ingredients:
+            raise CommandError('Нет тегов или ингредиентов, выполните migrate')
+        reader = User.objects.create_user(
+            username='query_budget_reader',
+            email='query_budget_reader@foodgram.local',
+            first_name='query',
+            last_name='budget',
+        )
+        authors = User.objects.bulk_create(
+            User(
+                username=f'query_budget_{number}',
+                email=f'query_budget_{number}@foodgram.local',
+                first_name='query',
+                last_name='budget',
+            ) for number in range(count)
+        )
+        Subscription.objects.bulk_create(
+            Subscription(author=author, subscriber=reader)
+            for author in authors
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'query budget {number}',
+                text='query budget',
+                image='images/query_budget.png',
+                cooking_time=1,
+            ) for number, author in enumerate(authors)
+        )
+        # bulk_create не отправляет сигналы, индекс SQLite заполняем сами
+        rebuild_search_index()
+        for recipe in recipes:
+            recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in ingredients
+        )
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=reader)}'
+        )
+        return client, recipes[0]
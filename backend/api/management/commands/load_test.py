@@ -0,0 +1,206 @@
+import json
+import math
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+SCENARIOS = (
+    ('список рецептов', '/api/recipes/?limit=10'),
+    ('фильтр по тегам', '/api/recipes/?tags={tag}&tags={other_tag}'),
+    ('избранное', '/api/recipes/?is_favorited=1&limit=10'),
+    ('поиск', '/api/recipes/?search={word}'),
+    ('рецепт', '/api/recipes/{recipe_id}/'),
+    ('подписки', '/api/users/subscriptions/?recipes_limit=3'),
+    ('ингредиенты', '/api/ingredients/?name={prefix}'),
+    ('список покупок', '/api/recipes/download_shopping_cart/'),
+)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class InProcessTransport:
+    """Запросы через django.test.Client с подсчетом SQL-запросов."""
+
+    def __init__(self):
+        self.client = Client()
+        self.headers = {}
+
+    def login(self, token):
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {token}'}
+
+    def request(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as context:
+            if method == 'POST':
+                response = self.client.post(
+                    path, data, content_type='application/json',
+                    **self.headers,
+                )
+            else:
+                response = self.client.get(path, **self.headers)
+            body = (
+                b''.join(response.streaming_content)
+                if response.streaming else response.content
+            )
+        return response.status_code, body, len(context.captured_queries)
+
+
+def server_timing_queries(headers):
+    """Число SQL-запросов из Server-Timing (api.middleware), если есть."""
+    match = re.search(r'db;[^,]*desc="(\d+) ', headers.get(
+        'Server-Timing', ''
+    ))
+    return int(match[1]) if match else None
+
+
+class HttpTransport:
+    """Запросы к запущенному серверу.
+
+    Число SQL-запросов берется из заголовка Server-Timing, его отдают
+    только замеряемые запросы (REQUEST_TIMING_SAMPLE_RATE на сервере).
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {}
+
+    def login(self, token):
+        self.headers = {'Authorization': f'Token {token}'}
+
+    def request(self, method, path, data=None):
+        headers = dict(self.headers)
+        if data is not None:
+            data = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        request = Request(
+            self.base_url + quote(path, safe='/?=&'),
+            data=data,
+            headers=headers,
+            method=method,
+        )
+        try:
+            with urlopen(request) as response:
+                return (
+                    response.status,
+                    response.read(),
+                    server_timing_queries(response.headers),
+                )
+        except HTTPError as error:
+            return (
+                error.code, error.read(), server_timing_queries(error.headers)
+            )
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест основных эндпоинтов: задержки p50/p95/p99, '
+            'пропускная способность и SQL-запросы на запрос. Данные можно '
+            'создать командой seed_foodgram.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            help='Адрес запущенного сервера, без него запросы идут '
+                 'внутри процесса и считаются SQL-запросы',
+        )
+        parser.add_argument('--email', default='seed0@example.com')
+        parser.add_argument('--password', default='foodgram-seed')
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Запросов на сценарий',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Параллельных запросов, только с --base-url',
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        if options['base_url']:
+            transport = HttpTransport(options['base_url'])
+            concurrency = options['concurrency']
+        else:
+            transport = InProcessTransport()
+            concurrency = 1
+        self._login(transport, options)
+        params = self._collect_params(transport)
+        self.stdout.write(
+            f'{"сценарий":16} {"ошибок":>7} {"p50, мс":>9} {"p95, мс":>9} '
+            f'{"p99, мс":>9} {"запр/с":>8} {"SQL":>6}'
+        )
+        for name, template in SCENARIOS:
+            self._run(
+                transport, name, template, params, options['requests'],
+                concurrency,
+            )
+
+    def _login(self, transport, options):
+        status, body, _ = transport.request(
+            'POST', '/api/auth/token/login/',
+            {'email': options['email'], 'password': options['password']},
+        )
+        token = json.loads(body or b'{}').get('auth_token')
+        if token is None:
+            raise CommandError(
+                f'Не удалось войти как {options["email"]}: {status}'
+            )
+        transport.login(token)
+
+    def _collect_params(self, transport):
+        _, body, _ = transport.request('GET', '/api/recipes/?limit=100')
+        recipes = json.loads(body)['results']
+        _, body, _ = transport.request('GET', '/api/tags/')
+        tags = [tag['slug'] for tag in json.loads(body)]
+        if not recipes or len(tags) < 2:
+            raise CommandError('Нет данных, запустите seed_foodgram')
+        return {
+            'recipe_id': [recipe['id'] for recipe in recipes],
+            'tag': tags,
+            'other_tag': tags,
+            'word': [recipe['name'].split()[0] for recipe in recipes],
+            'prefix': [
+                ingredient['name'][:2]
+                for recipe in recipes for ingredient in recipe['ingredients']
+            ],
+        }
+
+    def _run(self, transport, name, template, params, count, concurrency):
+        paths = [
+            template.format(**{
+                key: self.random.choice(values)
+                for key, values in params.items()
+            })
+            for _ in range(count)
+        ]
+
+        def timed(path):
+            started = time.perf_counter()
+            status, _, queries = transport.request('GET', path)
+            return time.perf_counter() - started, status, queries
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, paths))
+        elapsed = time.perf_counter() - started
+        timings = [duration * 1000 for duration, _, _ in results]
+        errors = sum(1 for _, status, _ in results if status >= 400)
+        queries = [count for _, _, count in results if count is not None]
+        average_queries = (
+            f'{sum(queries) / len(queries):6.1f}' if queries else f'{"-":>6}'
+        )
+        self.stdout.write(
+            f'{name:16} {errors:7} {percentile(timings, 50):9.1f} '
+            f'{percentile(timings, 95):9.1f} {percentile(timings, 99):9.1f} '
+            f'{len(results) / elapsed:8.1f} {average_queries}'
+        )
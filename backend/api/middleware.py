@@ -0,0 +1,326 @@
+import json
+import logging
+import random
+import re
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from foodgram.metrics import observe_request
+
+from .models import SlowQuery
+
+logger = logging.getLogger('api.timing')
+slow_query_logger = logging.getLogger('api.slow_queries')
+
+EXPLAINABLE = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+# Параметры таких запросов не пишутся никогда: в них ключи токенов
+# и хеши паролей
+SECRET_QUERY = re.compile(r'\b(authtoken_token|password)\b', re.IGNORECASE)
+
+# Медленные запросы, ждущие записи по сигналу request_finished
+pending_slow_queries = deque()
+
+query_wrappers = ContextVar('query_wrappers', default=())
+
+
+def run_query_wrappers(execute, sql, params, many, context):
+    """Обертка execute каждого соединения, см. api.signals.
+
+    Вызывает обертки, подключенные track_queries в текущем контексте.
+    Соединения привязаны к потокам, а контекст переходит и в потоки
+    sync_to_async, поэтому учитываются и запросы асинхронных
+    представлений.
+    """
+    for wrapper in reversed(query_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def track_queries(wrapper):
+    token = query_wrappers.set(query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        query_wrappers.reset(token)
+
+
+class QueryTimer:
+    """Обертка execute, считающая SQL-запросы и их суммарное время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def get_view_name(request):
+    """Имя обработчика вида RecipeViewSet.list или LoginView.post."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name
+    method = request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class RequestTimingMiddleware:
+    """Замеряет запросы для метрик Prometheus и выборочно отдает замеры.
+
+    db - число и время SQL-запросов, view - работа представления,
+    serialize - рендеринг ответа в JSON/CSV/текст, total - весь запрос.
+    Результат уходит в заголовок Server-Timing и в лог api.timing одной
+    JSON-строкой. Доля таких запросов - REQUEST_TIMING_SAMPLE_RATE,
+    в метрики (METRICS_ENABLED) попадают все.
+    У потоковых ответов время генерации тела не учитывается.
+    Работает и под WSGI, и под ASGI без перехода в поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Синхронные хуки Django вызвал бы через sync_to_async, а
+            # переход в поток им не нужен
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sampled = random.random() < settings.REQUEST_TIMING_SAMPLE_RATE
+        if not sampled and not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timer = QueryTimer()
+        request._timing = {}
+        started = time.perf_counter()
+        with track_queries(timer):
+            response = self.get_response(request)
+        self._finish(request, response, timer, started, sampled)
+        return response
+
+    async def __acall__(self, request):
+        sampled = random.random() < settings.REQUEST_TIMING_SAMPLE_RATE
+        if not sampled and not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        timer = QueryTimer()
+        request._timing = {}
+        started = time.perf_counter()
+        with track_queries(timer):
+            response = await self.get_response(request)
+        self._finish(request, response, timer, started, sampled)
+        return response
+
+    def _finish(self, request, response, timer, started, sampled):
+        total = time.perf_counter() - started
+        view_name = get_view_name(request)
+        if settings.METRICS_ENABLED:
+            observe_request(
+                view_name,
+                request.method,
+                response.status_code,
+                total,
+                timer.count,
+                timer.duration,
+                None if response.streaming else len(response.content),
+            )
+        if sampled:
+            self._report(request, response, view_name, timer, started, total)
+
+    def _report(self, request, response, view_name, timer, started, total):
+        view_started = request._timing.get('view_started', started)
+        view_finished = request._timing.get('view_finished', started + total)
+        metrics = {
+            'db': timer.duration,
+            'view': view_finished - view_started,
+            'serialize': started + total - view_finished,
+            'total': total,
+        }
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.1f}'
+            + (f';desc="{timer.count} queries"' if name == 'db' else '')
+            for name, duration in metrics.items()
+        )
+        logger.info(json.dumps({
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timer.count,
+            **{
+                f'{name}_ms': round(duration * 1000, 1)
+                for name, duration in metrics.items()
+            },
+        }, ensure_ascii=False))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self._mark(request, 'view_started')
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после этого хука: дальше идет сериализация
+        self._mark(request, 'view_finished')
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args,
+                            view_kwargs):
+        self._mark(request, 'view_started')
+
+    async def aprocess_template_response(self, request, response):
+        self._mark(request, 'view_finished')
+        return response
+
+    def _mark(self, request, name):
+        if hasattr(request, '_timing'):
+            request._timing[name] = time.perf_counter()
+
+
+def get_origin():
+    """Ближайший к запросу кадр стека из кода проекта."""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if (
+            frame.filename.startswith(base_dir)
+            and 'site-packages' not in frame.filename
+            and frame.filename != __file__
+        ):
+            path = Path(frame.filename).relative_to(base_dir)
+            return f'{path}:{frame.lineno} in {frame.name}'
+    return ''
+
+
+def explain(connection, sql, params):
+    """План запроса без ANALYZE: сам запрос повторно не выполняется."""
+    if not EXPLAINABLE.match(sql):
+        return ''
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}', params
+            )
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError as error:
+        return f'Не удалось получить план: {error}'
+
+
+def get_logged_params(sql, params):
+    if not settings.SLOW_QUERY_LOG_PARAMS or SECRET_QUERY.search(sql):
+        return ''
+    return repr(params)
+
+
+def save_slow_queries():
+    """Пишет накопленные медленные запросы с планами в лог и в SlowQuery."""
+    records = []
+    while pending_slow_queries:
+        query = pending_slow_queries.popleft()
+        params = query.pop('explain_params')
+        query['plan'] = (
+            explain(connections[query['database']], query['sql'], params)
+            if params is not None else ''
+        )
+        slow_query_logger.warning(json.dumps(query, ensure_ascii=False))
+        records.append(SlowQuery(**query))
+    if not records:
+        return
+    try:
+        SlowQuery.objects.bulk_create(records)
+        SlowQuery.objects.trim(settings.SLOW_QUERY_LOG_SIZE)
+    except DatabaseError:
+        slow_query_logger.exception('Не удалось сохранить медленные запросы')
+
+
+class SlowQueryLogger:
+    """Обертка execute, запоминающая запросы дольше порога."""
+
+    def __init__(self, request, threshold):
+        self.request = request
+        self.threshold = threshold
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                self.queries.append({
+                    'duration': round(duration * 1000, 1),
+                    'database': context['connection'].alias,
+                    'view': get_view_name(self.request) or '',
+                    'origin': get_origin(),
+                    'sql': sql,
+                    'params': get_logged_params(sql, params),
+                    # У executemany params - список наборов, план не нужен
+                    'explain_params': None if many else params,
+                })
+
+
+class SlowQueryMiddleware:
+    """Сохраняет SQL-запросы дольше SLOW_QUERY_THRESHOLD_MS.
+
+    Запрос, параметры, обработчик, место вызова и план запроса пишутся
+    в лог api.slow_queries и в SlowQuery: это кольцевой буфер из
+    SLOW_QUERY_LOG_SIZE последних записей, он виден в админке.
+    Значения параметров пишутся только с SLOW_QUERY_LOG_PARAMS и никогда
+    для запросов к токенам и паролям. Middleware лишь копит запросы,
+    план и запись делает save_slow_queries по сигналу request_finished,
+    то есть когда ответ уже отдан.
+    Запросы при генерации тела потоковых ответов не отслеживаются.
+    У запросов асинхронных представлений места вызова нет: ORM выполняет
+    их в отдельном потоке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.SLOW_QUERY_THRESHOLD_MS:
+            return self.get_response(request)
+        slow_queries = SlowQueryLogger(
+            request, settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        )
+        with track_queries(slow_queries):
+            response = self.get_response(request)
+        pending_slow_queries.extend(slow_queries.queries)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.SLOW_QUERY_THRESHOLD_MS:
+            return await self.get_response(request)
+        slow_queries = SlowQueryLogger(
+            request, settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        )
+        with track_queries(slow_queries):
+            response = await self.get_response(request)
+        pending_slow_queries.extend(slow_queries.queries)
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('duration', models.FloatField(verbose_name='Длительность, мс')),
+                ('database', models.CharField(max_length=50, verbose_name='База')),
+                ('view', models.CharField(blank=True, max_length=200, verbose_name='Обработчик')),
+                ('origin', models.CharField(blank=True, max_length=500, verbose_name='Место вызова')),
+                ('sql', models.TextField(verbose_name='SQL')),
+                ('params', models.TextField(blank=True, verbose_name='Параметры')),
+                ('plan', models.TextField(blank=True, verbose_name='План запроса')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ('-id',),
+            },
+        ),
+    ]
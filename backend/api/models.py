@@ -0,0 +1,44 @@
+from django.db import models
+
+
+class SlowQueryQuerySet(models.QuerySet):
+
+    def trim(self, size):
+        """Оставляет только size последних записей."""
+        self.filter(
+            id__in=self.order_by('-id').values('id')[size:]
+        ).delete()
+
+
+class SlowQuery(models.Model):
+    """Медленный SQL-запрос, см. api.middleware.SlowQueryMiddleware."""
+
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата',
+    )
+    duration = models.FloatField(verbose_name='Длительность, мс')
+    database = models.CharField(max_length=50, verbose_name='База')
+    view = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='Обработчик',
+    )
+    origin = models.CharField(
+        max_length=500,
+        blank=True,
+        verbose_name='Место вызова',
+    )
+    sql = models.TextField(verbose_name='SQL')
+    params = models.TextField(blank=True, verbose_name='Параметры')
+    plan = models.TextField(blank=True, verbose_name='План запроса')
+
+    objects = SlowQueryQuerySet.as_manager()
+
+    class Meta():
+        ordering = ('-id',)
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+
+    def __str__(self):
+        return f'{self.view or "-"}: {self.duration:.0f} мс'
@@ -1,7 +1,240 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+from datetime import datetime
+from functools import partial
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-class RecipePagination(PageNumberPagination):
+
+class AsyncPaginator(Paginator):
+    """Paginator с acount() для асинхронных представлений."""
+
+    async def acount(self):
+        """Считает записи через async ORM, дальше count берется готовым."""
+        if 'count' not in self.__dict__:
+            self.__dict__['count'] = await self.object_list.acount()
+        return self.count
+
+
+class CachedCountPaginator(AsyncPaginator):
+    """Paginator, который кеширует COUNT(*) для одинаковых запросов.
+
+    scope добавляется к ключу, например id пользователя для личных
+    фильтров.
+    """
+
+    def __init__(self, *args, scope=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scope = scope
+
+    def get_count_key(self):
+        try:
+            query = str(self.object_list.query).encode()
+        except EmptyResultSet:
+            return None
+        key = f'pagination_count:{hashlib.md5(query).hexdigest()}'
+        return f'{key}:{self.scope}' if self.scope is not None else key
+
+    @cached_property
+    def count(self):
+        key = self.get_count_key()
+        if key is None:
+            return super().count
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    async def acount(self):
+        if 'count' in self.__dict__:
+            return self.count
+        key = self.get_count_key()
+        count = await cache.aget(key) if key is not None else None
+        if count is None:
+            count = await self.object_list.acount()
+            if key is not None:
+                await cache.aset(
+                    key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT
+                )
+        self.__dict__['count'] = count
+        return count
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """PageNumberPagination с apaginate_queryset для async ORM."""
+
+    django_paginator_class = AsyncPaginator
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        await paginator.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        self.page.object_list = [
+            item async for item in self.page.object_list
+        ]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class RecipePagination(AsyncPageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     page_size = 10
     page_size_query_param = 'limit'
     max_page_size = 1000
+    user_filters = ('is_favorited', 'is_in_shopping_cart')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = self.get_paginator_class(request)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = self.get_paginator_class(request)
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def get_paginator_class(self, request):
+        """С личными фильтрами счетчик кешируется для каждого пользователя."""
+        if request.user.is_authenticated and any(
+            request.query_params.get(name) for name in self.user_filters
+        ):
+            return partial(CachedCountPaginator, scope=request.user.pk)
+        return CachedCountPaginator
+
+
+class RecipeCursorPagination(BasePagination):
+    """Keyset-пагинация по (-pub_date, id) без COUNT и OFFSET.
+
+    Включается параметром `cursor`, на первой странице он может быть пустым.
+    Вместе с `search` курсор не действует: результаты поиска упорядочены
+    по релевантности и листаются обычной пагинацией.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = RecipePagination.page_size
+    page_size_query_param = RecipePagination.page_size_query_param
+    max_page_size = RecipePagination.max_page_size
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._get_page_queryset(queryset, request)
+        return self._set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self._get_page_queryset(queryset, request)
+        return self._set_page([recipe async for recipe in queryset])
+
+    def _get_page_queryset(self, queryset, request):
+        """Запрос страницы с одной лишней записью для has_next."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = limit = self.get_page_size(request)
+        self.position = position = self.decode_cursor(request)
+        queryset = queryset.order_by('-pub_date', 'id')
+        if position is not None:
+            pub_date, pk, reverse = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+                ).order_by('pub_date', '-id')
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+                )
+        else:
+            reverse = False
+        self.reverse = reverse
+        return queryset[:limit + 1]
+
+    def _set_page(self, results):
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if self.reverse:
+            results.reverse()
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = (
+            has_more if self.reverse else self.position is not None
+        )
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return (
+                datetime.fromisoformat(position['d']),
+                int(position['i']),
+                bool(position.get('r')),
+            )
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, recipe, reverse):
+        position = {'d': recipe.pub_date.isoformat(), 'i': recipe.id}
+        if reverse:
+            position['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode())
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded.decode()
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
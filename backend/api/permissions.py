@@ -1,3 +1,6 @@
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -10,3 +13,20 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
             request.method in permissions.SAFE_METHODS
             or obj.author == request.user
         )
+
+
+class IsStaffOrInternal(permissions.BasePermission):
+    """Сотрудники или запросы из сетей METRICS_ALLOWED_NETWORKS."""
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        try:
+            address = ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            # Под ASGI адреса может не быть, например за unix-сокетом
+            return False
+        return any(
+            address in ip_network(network)
+            for network in settings.METRICS_ALLOWED_NETWORKS
+        )
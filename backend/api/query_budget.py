@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(limit, name='', using=DEFAULT_DB_ALIAS):
+    """Падает, если внутри блока выполнено больше `limit` SQL-запросов."""
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    executed = len(context.captured_queries)
+    if executed > limit:
+        queries = '\n'.join(
+            query['sql'] for query in context.captured_queries
+        )
+        raise QueryBudgetExceeded(
+            f'{name}: {executed} запросов при бюджете {limit}\n{queries}'
+        )
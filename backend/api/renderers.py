@@ -0,0 +1,19 @@
+from rest_framework import renderers
+
+
+class PlainTextRenderer(renderers.BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
@@ -1,13 +1,21 @@
 import re
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from rest_framework import serializers
 
+from recipes.cache import (aget_recipe_fragments, aset_recipe_fragments,
+                           get_recipe_fragments, invalidate_recipes_on_commit,
+                           set_recipe_fragments)
 from recipes.models import (Favorites, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag,
+                            recipe_prefetches)
+from recipes.renditions import get_image_urls
 from users.models import Subscription, User
 
-from .utils import Base64ImageField
+from .utils import Base64ImageField, PrimaryKeyListField
 
 
 class SignUpSerializer(serializers.ModelSerializer):
@@ -57,10 +65,16 @@ class UserSerializer(SignUpSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
-        return user.is_authenticated and obj.author.filter(
-            subscriber=user
-        ).exists()
+        if not user.is_authenticated:
+            return False
+        if 'subscribed_ids' not in self.context:
+            self.context['subscribed_ids'] = set(
+                user.subscriber.values_list('author_id', flat=True)
+            )
+        return obj.id in self.context['subscribed_ids']
 
     class Meta:
         model = User
@@ -87,19 +101,14 @@ class RecipeFavoriteCartSerializer(serializers.ModelSerializer):
 
 
 class UserSubscribeSerializer(serializers.ModelSerializer):
-    recipes = serializers.SerializerMethodField()
+    recipes = RecipeFavoriteCartSerializer(
+        source='latest_recipes',
+        many=True,
+        read_only=True,
+    )
     is_subscribed = serializers.BooleanField(read_only=True)
-    recipes_count = serializers.SerializerMethodField()
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-    def get_recipes(self, obj):
-        recipes_limit = self.context.get('recipes_limit')
-        recipes = obj.recipes.all()[:recipes_limit]
-        return RecipeFavoriteCartSerializer(
-            recipes, many=True, context=self.context
-        ).data
+    recipes_count = serializers.IntegerField(read_only=True)
+    subscribers_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -112,6 +121,7 @@ class UserSubscribeSerializer(serializers.ModelSerializer):
             'is_subscribed',
             'recipes',
             'recipes_count',
+            'subscribers_count',
         ]
 
 
@@ -167,19 +177,126 @@ class IngridientsSerializer(serializers.ModelSerializer):
         ]
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        fragments = self.child.get_fragments(recipes)
+        return [
+            self.child.to_representation(recipe, fragments[recipe.id])
+            for recipe in recipes
+        ]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
+    """Рецепт для чтения.
+
+    Не зависящая от пользователя часть хранится в кеше (recipes.cache),
+    is_subscribed, is_favorited и is_in_shopping_cart подставляются
+    при каждом ответе. Асинхронные представления заранее вызывают aload,
+    и to_representation уже не обращается к базе и кешу.
+    """
     author = UserSerializer(many=False)
     tags = TagSerializer(many=True)
-    ingredients = serializers.SerializerMethodField()
+    ingredients = IngridientsInRecipeSerializer(
+        source='ingredientinrecipe_set',
+        many=True,
+    )
+    images = serializers.DictField(read_only=True)
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
-    def get_ingredients(self, obj):
-        return IngridientsInRecipeSerializer(
-            IngredientInRecipe.objects.filter(recipe=obj).all(), many=True
-        ).data
+    def to_representation(self, instance, fragment=None):
+        if fragment is None:
+            fragment = self.get_fragments([instance])[instance.id]
+        data = dict(fragment)
+        data['author'] = dict(
+            fragment['author'],
+            is_subscribed=self.fields['author'].get_is_subscribed(
+                instance.author
+            ),
+        )
+        request = self.context.get('request')
+        if data['image'] and request is not None:
+            data['image'] = request.build_absolute_uri(data['image'])
+            data['images'] = {
+                size: {
+                    extension: request.build_absolute_uri(url)
+                    for extension, url in urls.items()
+                }
+                for size, urls in fragment['images'].items()
+            }
+        data['is_favorited'] = getattr(instance, 'is_favorited', False)
+        data['is_in_shopping_cart'] = getattr(
+            instance, 'is_in_shopping_cart', False
+        )
+        return data
+
+    def get_fragments(self, recipes):
+        if 'fragments' in self.context:
+            return self.context['fragments']
+        fragments = get_recipe_fragments([recipe.id for recipe in recipes])
+        missed = [recipe for recipe in recipes if recipe.id not in fragments]
+        if missed:
+            prefetch_related_objects(missed, *recipe_prefetches())
+            missed_fragments = {
+                recipe.id: self._build_fragment(recipe) for recipe in missed
+            }
+            set_recipe_fragments(missed_fragments)
+            fragments.update(missed_fragments)
+        return fragments
+
+    async def aload(self, recipes):
+        """Загружает в контекст части рецептов и подписки пользователя.
+
+        prefetch_related в async ORM Django 4.1 нет, связи рецептов, которых
+        нет в кеше, подгружаются в потоке.
+        """
+        user = self.context['request'].user
+        if user.is_authenticated and 'subscribed_ids' not in self.context:
+            self.context['subscribed_ids'] = {
+                author_id async for author_id in user.subscriber.values_list(
+                    'author_id', flat=True
+                )
+            }
+        fragments = await aget_recipe_fragments(
+            [recipe.id for recipe in recipes]
+        )
+        missed = [recipe for recipe in recipes if recipe.id not in fragments]
+        if missed:
+            await sync_to_async(prefetch_related_objects)(
+                missed, *recipe_prefetches()
+            )
+            missed_fragments = {
+                recipe.id: self._build_fragment(recipe) for recipe in missed
+            }
+            await aset_recipe_fragments(missed_fragments)
+            fragments.update(missed_fragments)
+        self.context['fragments'] = fragments
+
+    def _build_fragment(self, recipe, tags=None, ingredients=None):
+        if tags is None:
+            tags = recipe.tags.all()
+        if ingredients is None:
+            ingredients = recipe.ingredientinrecipe_set.all()
+        author = self.fields['author'].to_representation(recipe.author)
+        del author['is_subscribed']
+        return {
+            'author': author,
+            'id': recipe.id,
+            'name': recipe.name,
+            'text': recipe.text,
+            'image': recipe.image.url if recipe.image else None,
+            'images': get_image_urls(recipe),
+            'cooking_time': recipe.cooking_time,
+            'tags': self.fields['tags'].to_representation(tags),
+            'ingredients': self.fields['ingredients'].to_representation(
+                ingredients
+            ),
+        }
 
     class Meta:
+        list_serializer_class = RecipeListSerializer
         model = Recipe
         fields = [
             'author',
@@ -187,6 +304,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'name',
             'text',
             'image',
+            'images',
             'cooking_time',
             'tags',
             'ingredients',
@@ -195,10 +313,38 @@ class RecipeSerializer(serializers.ModelSerializer):
         ]
 
 
+class IngridientsInRecipeListSerializer(serializers.ListSerializer):
+    """Проверяет id всех ингредиентов рецепта одним запросом."""
+
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        ingredients = Ingredient.objects.in_bulk(
+            [item['id'] for item in attrs]
+        )
+        errors = []
+        seen = set()
+        for item in attrs:
+            pk = item['id']
+            if pk in seen:
+                errors.append({'id': [
+                    f'Ингредиент {pk} указан несколько раз.'
+                ]})
+            elif pk not in ingredients:
+                errors.append({'id': [
+                    f'Ингредиента с id {pk} не существует.'
+                ]})
+            else:
+                errors.append({})
+            seen.add(pk)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return [
+            {**item, 'id': ingredients[item['id']]} for item in attrs
+        ]
+
+
 class IngridientsInRecipeCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(min_value=1)
     recipe = serializers.PrimaryKeyRelatedField(read_only=True)
     amount = serializers.IntegerField(write_only=True, min_value=1)
 
@@ -209,14 +355,12 @@ class IngridientsInRecipeCreateSerializer(serializers.ModelSerializer):
             'recipe',
             'amount',
         ]
+        list_serializer_class = IngridientsInRecipeListSerializer
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     author = UserSerializer(required=False)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     ingredients = IngridientsInRecipeCreateSerializer(many=True)
     image = Base64ImageField()
 
@@ -226,19 +370,47 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        self._create_ingredients(ingredients, recipe)
+        self._tags = tags
+        self._ingredients = self._create_ingredients(ingredients, recipe)
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
+        self._tags = self._ingredients = None
         if tags:
             instance.tags.set(tags)
+            self._tags = tags
+        relations_changed = False
         if ingredients:
-            instance.ingredients.clear()
-        self._create_ingredients(ingredients, instance)
-        return super().update(instance, validated_data)
+            self._ingredients, old_amounts = self._update_ingredients(
+                ingredients, instance
+            )
+            relations_changed = old_amounts != {
+                item.ingredient_id: item.amount for item in self._ingredients
+            }
+            if relations_changed:
+                ShoppingListItem.objects.change_recipe(
+                    instance.id, old_amounts
+                )
+        # Автора рецепта сменить нельзя
+        validated_data.pop('author', None)
+        # Новый файл картинки всегда отличается от сохраненного
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+        elif relations_changed:
+            # bulk-операции не отправляют сигналы, а save не вызывался
+            invalidate_recipes_on_commit([instance.id])
+        return instance
 
     def _create_ingredients(self, ingredients, recipe):
         recipe_ingredients = [IngredientInRecipe(
@@ -247,9 +419,67 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             amount=ingredient['amount'],
         ) for ingredient in ingredients]
         IngredientInRecipe.objects.bulk_create(recipe_ingredients)
+        return recipe_ingredients
+
+    def _update_ingredients(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к новому списку.
+
+        Возвращает ингредиенты рецепта после изменения
+        и прежние количества {id ингредиента: количество}.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        }
+        recipe_ingredients = []
+        changed = []
+        added = []
+        for ingredient in ingredients:
+            item = current.pop(ingredient['id'].id, None)
+            if item is None:
+                item = IngredientInRecipe(
+                    recipe=recipe,
+                    ingredient=ingredient['id'],
+                    amount=ingredient['amount'],
+                )
+                added.append(item)
+            else:
+                item.ingredient = ingredient['id']
+                if item.amount != ingredient['amount']:
+                    item.amount = ingredient['amount']
+                    changed.append(item)
+            recipe_ingredients.append(item)
+        if current:
+            rows = IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=current
+            )
+            rows.delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        if added:
+            IngredientInRecipe.objects.bulk_create(added)
+        return recipe_ingredients, old_amounts
 
     def to_representation(self, instance):
-        return RecipeSerializer(instance, context=self.context).data
+        """Ответ собирается из объектов, оставшихся после записи."""
+        tags = getattr(self, '_tags', None)
+        if tags is None:
+            tags = instance.tags.all()
+        ingredients = getattr(self, '_ingredients', None)
+        if ingredients is None:
+            ingredients = instance.ingredientinrecipe_set.select_related(
+                'ingredient'
+            )
+        # Рецепт меняет только автор, а на себя подписаться нельзя
+        instance.author.is_subscribed = False
+        serializer = RecipeSerializer(instance, context=self.context)
+        return serializer.to_representation(
+            instance, serializer._build_fragment(instance, tags, ingredients)
+        )
 
     class Meta:
         model = Recipe
@@ -264,6 +494,43 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ]
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.IntegerField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = [
+            'id',
+            'name',
+            'measurement_unit',
+            'amount',
+        ]
+
+
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE,
+    )
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    author = serializers.IntegerField(required=False, min_value=1)
+    tags = serializers.ListField(
+        child=serializers.SlugField(),
+        required=False,
+    )
+    is_favorited = serializers.BooleanField(required=False)
+    is_in_shopping_cart = serializers.BooleanField(required=False)
+    search = serializers.CharField(required=False, max_length=200)
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
 
     class Meta:
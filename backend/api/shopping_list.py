@@ -0,0 +1,146 @@
+"""Выгрузка списка покупок в txt, csv и json.
+
+Список отдается потоком по мере чтения строк из базы, со stream=False -
+целиком. Готовый файл кешируется по хешу содержимого корзины, поэтому
+повторная выгрузка неизмененной корзины не выполняет агрегацию заново.
+"""
+import csv
+import hashlib
+import io
+import json
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+
+from recipes.models import CatalogueVersion, ShoppingCart, ShoppingListItem
+
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+def get_shopping_list(user):
+    """Ингредиенты корзины: (название, единица, сумма, [(рецепт, кол-во)]).
+
+    Суммы берутся из ShoppingListItem, порядок: по убыванию суммы, затем
+    по названию и единице измерения. Суммы и строки по рецептам читаются
+    одним запросом, то есть из одного снимка базы, и группируются по
+    ингредиенту, так что в памяти только текущий ингредиент.
+    """
+    lines = 'ingredient__ingredientinrecipe'
+    rows = ShoppingListItem.objects.filter(
+        user=user, **{f'{lines}__recipe__shopping_cart__user': user}
+    ).order_by(
+        '-total_amount',
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'ingredient_id',
+        f'{lines}__recipe__name',
+        f'{lines}__recipe_id',
+    ).values_list(
+        'ingredient_id',
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'total_amount',
+        f'{lines}__recipe__name',
+        f'{lines}__amount',
+    ).iterator(chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+    for _, group in groupby(rows, key=itemgetter(0)):
+        first = next(group)
+        recipes = [(first[4], first[5])]
+        recipes.extend((row[4], row[5]) for row in group)
+        yield first[1], first[2], first[3], recipes
+
+
+def render_txt(items):
+    for name, unit, total, recipes in items:
+        yield f'{name} - {total} {unit}\n'
+        for recipe, amount in recipes:
+            yield f'    {recipe}: {amount} {unit}\n'
+    yield settings.FILE_MESSAGE
+
+
+def render_csv(items):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        ('ingredient', 'measurement_unit', 'total', 'recipe', 'amount')
+    )
+    for name, unit, total, recipes in items:
+        for recipe, amount in recipes:
+            writer.writerow((name, unit, total, recipe, amount))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_json(items):
+    separator = '['
+    for name, unit, total, recipes in items:
+        yield separator + json.dumps({
+            'name': name,
+            'measurement_unit': unit,
+            'total': total,
+            'recipes': [
+                {'name': recipe, 'amount': amount}
+                for recipe, amount in recipes
+            ],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'json': render_json,
+}
+
+
+def get_cart_hash(user):
+    """Хеш состава корзины и версии рецептов."""
+    recipe_ids = ShoppingCart.objects.filter(user=user).order_by(
+        'recipe_id'
+    ).values_list('recipe_id', flat=True)
+    version = CatalogueVersion.objects.filter(name='recipes').values_list(
+        'version', flat=True
+    ).first()
+    content = f'{version}:{",".join(map(str, recipe_ids))}'
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def _stream_and_cache(chunks, key):
+    content = []
+    for chunk in chunks:
+        chunk = chunk.encode()
+        content.append(chunk)
+        yield chunk
+    cache.set(
+        key, b''.join(content), settings.SHOPPING_LIST_CACHE_TIMEOUT
+    )
+
+
+def shopping_list_response(user, export_format, stream=True):
+    key = f'shopping_list:{user.id}:{export_format}:{get_cart_hash(user)}'
+    content = cache.get(key)
+    if content is not None:
+        chunks = [content]
+    else:
+        chunks = _stream_and_cache(
+            RENDERERS[export_format](get_shopping_list(user)), key
+        )
+        if not stream:
+            chunks = [b''.join(chunks)]
+    response = StreamingHttpResponse(
+        chunks, content_type=CONTENT_TYPES[export_format]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{export_format}"'
+    )
+    return response
@@ -0,0 +1,18 @@
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .middleware import run_query_wrappers, save_slow_queries
+
+
+@receiver(connection_created)
+def install_query_wrappers(sender, connection, **kwargs):
+    # Сигнал приходит при каждом переподключении того же объекта
+    if run_query_wrappers not in connection.execute_wrappers:
+        # В начало списка: execute_wrapper() снимает последнюю обертку
+        connection.execute_wrappers.insert(0, run_query_wrappers)
+
+
+@receiver(request_finished)
+def save_slow_query_log(sender, **kwargs):
+    save_slow_queries()
@@ -0,0 +1,184 @@
+"""Чтение рецептов, тегов, ингредиентов и подписок.
+
+Одни и те же проверки гоняются для синхронных представлений и для
+асинхронных (api.async_views), чтобы две копии путей чтения не
+разошлись. as_view выбирает вариант при импорте адресов, поэтому
+адреса перезагружаются с нужным ASYNC_READ_VIEWS.
+"""
+import importlib
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import clear_url_caches, resolve
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Favorites, Ingredient, IngredientInRecipe, Recipe,
+                            Tag)
+from users.authentication import token_cache
+from users.models import Subscription, User
+
+
+def reload_urls():
+    for module in ('api.urls', settings.ROOT_URLCONF):
+        importlib.reload(importlib.import_module(module))
+    clear_url_caches()
+
+
+class ReadViewsTests:
+    async_views = False
+
+    @classmethod
+    def setUpClass(cls):
+        cls.settings_override = override_settings(
+            ASYNC_READ_VIEWS=cls.async_views
+        )
+        cls.settings_override.enable()
+        reload_urls()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        reload_urls()
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_data()
+
+    @classmethod
+    def create_data(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='author-password', first_name='Иван',
+            last_name='Петров',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            password='reader-password', first_name='Анна',
+            last_name='Смирнова',
+        )
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Борщ', text='Свекла и капуста',
+            cooking_time=60,
+        )
+        cls.recipe.tags.add(Tag.objects.first())
+        IngredientInRecipe.objects.create(
+            recipe=cls.recipe, ingredient=Ingredient.objects.first(),
+            amount=300,
+        )
+        Favorites.objects.create(user=cls.reader, recipe=cls.recipe)
+        Subscription.objects.create(author=cls.author, subscriber=cls.reader)
+
+    def setUp(self):
+        # Кеш рецептов и токенов живет в процессе, а база откатывается
+        cache.clear()
+        token_cache.clear()
+
+    def get(self, path, token=None, **headers):
+        if token is not None:
+            headers['authorization'] = f'Token {token}'
+        if self.async_views:
+            return async_to_sync(self.async_client.get)(path, **headers)
+        return self.client.get(path, **{
+            f'HTTP_{name.upper()}': value for name, value in headers.items()
+        })
+
+    def test_views_match_setting(self):
+        for path in ('/api/recipes/', '/api/users/subscriptions/'):
+            with self.subTest(path=path):
+                self.assertEqual(
+                    iscoroutinefunction(resolve(path).func), self.async_views
+                )
+
+    def test_recipe_list_flags(self):
+        response = self.get('/api/recipes/', token=self.token.key)
+        self.assertEqual(response.status_code, 200)
+        recipe = response.json()['results'][0]
+        self.assertEqual(recipe['id'], self.recipe.id)
+        self.assertTrue(recipe['is_favorited'])
+        self.assertFalse(recipe['is_in_shopping_cart'])
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(len(recipe['ingredients']), 1)
+
+    def test_recipe_list_anonymous(self):
+        response = self.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        recipe = response.json()['results'][0]
+        self.assertFalse(recipe['is_favorited'])
+        self.assertFalse(recipe['author']['is_subscribed'])
+
+    def test_recipe_detail_flags(self):
+        response = self.get(
+            f'/api/recipes/{self.recipe.id}/', token=self.token.key
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorited'])
+        self.assertTrue(response.json()['author']['is_subscribed'])
+
+    def test_recipe_detail_not_found(self):
+        response = self.get(f'/api/recipes/{self.recipe.id + 1}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_token(self):
+        for path in (
+            '/api/recipes/', '/api/tags/', '/api/users/subscriptions/',
+        ):
+            with self.subTest(path=path):
+                response = self.get(path, token='invalid')
+                self.assertEqual(response.status_code, 401)
+
+    def test_subscriptions(self):
+        response = self.get('/api/users/subscriptions/', token=self.token.key)
+        self.assertEqual(response.status_code, 200)
+        author = response.json()['results'][0]
+        self.assertEqual(author['id'], self.author.id)
+        self.assertTrue(author['is_subscribed'])
+        self.assertEqual(author['recipes_count'], 1)
+        self.assertEqual(author['recipes'][0]['id'], self.recipe.id)
+
+    def test_subscriptions_anonymous(self):
+        response = self.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_me(self):
+        response = self.get('/api/users/me/', token=self.token.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'reader')
+        self.assertEqual(response.json()['first_name'], 'Анна')
+
+    def test_not_modified(self):
+        for path in (
+            '/api/tags/',
+            '/api/ingredients/?name=а',
+            f'/api/recipes/{self.recipe.id}/',
+        ):
+            with self.subTest(path=path):
+                response = self.get(path)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                response = self.get(path, if_none_match=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_modified_after_change(self):
+        response = self.get('/api/tags/')
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Перекус', color='#000000', slug='snack')
+        response = self.get('/api/tags/', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('snack', [tag['slug'] for tag in response.json()])
+
+
+class SyncReadViewsTests(ReadViewsTests, TestCase):
+    async_views = False
+
+
+class AsyncReadViewsTests(ReadViewsTests, TestCase):
+    async_views = True
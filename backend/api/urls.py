@@ -1,8 +1,8 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import (IngredientViewSet, LoginView, LogoutView, RecipeViewSet,
-                    TagViewSet, UserViewSet)
+from .views import (IngredientViewSet, LoginView, LogoutView, MetricsView,
+                    RecipeViewSet, TagViewSet, UserViewSet)
 
 router = DefaultRouter()
 router.register('tags', TagViewSet)
@@ -14,4 +14,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('auth/token/login/', LoginView.as_view()),
     path('auth/token/logout/', LogoutView.as_view()),
+    re_path(r'^metrics/?$', MetricsView.as_view()),
 ]
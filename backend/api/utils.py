@@ -1,13 +1,149 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 from rest_framework import serializers
 
+BASE64_MARKER = ';base64,'
+BASE64_CHUNK_SIZE = 64 * 1024
+# Переносы строк и пробелы внутри base64 (например, после base64 -w 76)
+BASE64_WHITESPACE = str.maketrans('', '', ' \t\n\r\v\f')
+
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка в виде data URI или обычного файла.
+
+    base64 декодируется кусками во временный файл, который уходит на диск
+    после FILE_UPLOAD_MAX_MEMORY_SIZE. Размер в байтах и мегапикселях
+    проверяется до полного декодирования картинки, формат определяется
+    по содержимому, а не по заголовку data URI.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректная картинка в base64.',
+        'too_large': 'Размер картинки больше {max_size} байт.',
+        'too_many_pixels': 'Картинка больше {max_megapixels} Мп.',
+        'unsupported_format': 'Допустимые форматы: {formats}.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self._decode(data)
+        elif not hasattr(data, 'read'):
+            return super().to_internal_value(data)
+        elif data.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+        extension = self._check_image(data)
+        data.name = f'image.{extension}'
         return super().to_internal_value(data)
+
+    def _decode(self, data):
+        start = data.find(BASE64_MARKER)
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(BASE64_MARKER)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        rest = ''
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = rest + data[
+                    offset:offset + BASE64_CHUNK_SIZE
+                ].translate(BASE64_WHITESPACE)
+                # Декодируется кратная 4 часть, остаток уходит в следующий
+                # кусок
+                end = len(chunk) - len(chunk) % 4
+                rest = chunk[end:]
+                file.write(base64.b64decode(chunk[:end], validate=True))
+                if file.tell() > settings.IMAGE_UPLOAD_MAX_SIZE:
+                    file.close()
+                    self.fail(
+                        'too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE
+                    )
+            # Неполная четверка символов в конце - ошибка декодирования
+            file.write(base64.b64decode(rest, validate=True))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        size = file.tell()
+        file.seek(0)
+        return UploadedFile(file, name='image', size=size)
+
+    def _check_image(self, file):
+        """Проверяет формат и размеры по заголовку картинки."""
+        formats = settings.IMAGE_UPLOAD_FORMATS
+        max_pixels = settings.IMAGE_UPLOAD_MAX_MEGAPIXELS * 1_000_000
+        try:
+            with Image.open(file, formats=formats) as image:
+                width, height = image.size
+                image_format = image.format
+        except Image.UnidentifiedImageError:
+            self.fail('unsupported_format', formats=', '.join(formats))
+        except Image.DecompressionBombError:
+            width = height = None
+        finally:
+            file.seek(0)
+        if width is None or width * height > max_pixels:
+            self.fail(
+                'too_many_pixels',
+                max_megapixels=settings.IMAGE_UPLOAD_MAX_MEGAPIXELS,
+            )
+        return image_format.lower()
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """Список id, который превращается в объекты одним запросом."""
+
+    default_error_messages = {
+        'duplicate': 'Значение {pk_value} указано несколько раз.',
+        'does_not_exist': 'Объекта с id {pk_value} не существует.',
+    }
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        kwargs.setdefault('child', serializers.IntegerField(min_value=1))
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.queryset.all().in_bulk(pks)
+        errors = {}
+        seen = set()
+        for index, pk in enumerate(pks):
+            if pk in seen:
+                errors[index] = [self.error_messages['duplicate'].format(
+                    pk_value=pk
+                )]
+            elif pk not in objects:
+                errors[index] = [self.error_messages[
+                    'does_not_exist'
+                ].format(pk_value=pk)]
+            seen.add(pk)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [objects[pk] for pk in pks]
+
+    def to_representation(self, data):
+        return [item.pk for item in data.all()]
+
+
+def batch_results(ids, found, changed, changed_status, unchanged_status,
+                  invalid=()):
+    """Статус каждого id пакетного запроса в порядке запроса."""
+    changed = set(changed)
+    results = []
+    for pk in dict.fromkeys(ids):
+        if pk in invalid:
+            result = 'invalid'
+        elif pk not in found:
+            result = 'not_found'
+        elif pk in changed:
+            result = changed_status
+        else:
+            result = unchanged_status
+        results.append({'id': pk, 'status': result})
+    return results
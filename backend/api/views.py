@@ -1,21 +1,33 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db.models import Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Value
 from django.http import HttpResponse
+from django.utils.decorators import method_decorator
 from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.validators import ValidationError
 from rest_framework.views import APIView
 
 from api import serializers
+from foodgram.metrics import render_metrics
 from recipes import models
+from recipes.ingredient_index import ingredient_index
 from users.models import Subscription, User
 
-from .filters import recipe_queryset_fiter
-from .pagination import RecipePagination
-from .permissions import IsAuthorOrReadOnly
+from .async_views import AsyncReadMixin
+from .conditional import catalogue_condition, get_catalogue_version
+from .filters import RecipeFilterBackend
+from .pagination import RecipeCursorPagination, RecipePagination
+from .permissions import IsAuthorOrReadOnly, IsStaffOrInternal
+from .renderers import CSVRenderer, PlainTextRenderer
+from .shopping_list import shopping_list_response
+from .utils import batch_results
 
 
 class LoginView(APIView):
@@ -44,7 +56,16 @@ class LogoutView(APIView):
         return Response(data={'message': 'Пользователь не авторизван'})
 
 
+class MetricsView(APIView):
+    permission_classes = [IsStaffOrInternal]
+
+    def get(self, request):
+        body, content_type = render_metrics()
+        return HttpResponse(body, content_type=content_type)
+
+
 class UserViewSet(
+    AsyncReadMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -52,8 +73,23 @@ class UserViewSet(
 ):
     queryset = User.objects.all()
 
+    def get_queryset(self):
+        user = self.request.user
+        return User.objects.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                author=OuterRef('id'),
+                subscriber=user,
+            )) if user.is_authenticated else Value(False)
+        )
+
     def get_permissions(self):
-        if self.action in ('me', 'set_password', 'subscribe', 'subscriptions'):
+        if self.action in (
+            'me',
+            'set_password',
+            'subscribe',
+            'subscribe_batch',
+            'subscriptions',
+        ):
             return [permissions.IsAuthenticated()]
         if self.action == 'destroy':
             return [IsAuthorOrReadOnly()]
@@ -66,7 +102,10 @@ class UserViewSet(
 
     @action(detail=False, methods=['get'])
     def me(self, request):
-        serializer = self.get_serializer(request.user)
+        # В request.user из кеша токенов есть не все поля
+        serializer = self.get_serializer(
+            self.get_queryset().get(pk=request.user.pk)
+        )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'])
@@ -77,7 +116,7 @@ class UserViewSet(
         if user.check_password(serializer.data.get('current_password')):
             new_password = serializer.data.get('new_password')
             user.set_password(new_password)
-            user.save()
+            user.save(update_fields=['password'])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             data={'message': 'Текущий пароль не совпадает'},
@@ -85,14 +124,17 @@ class UserViewSet(
         )
 
     @action(detail=True, methods=['post', 'delete'])
+    @transaction.atomic
     def subscribe(self, request, pk):
         data = {'author': pk, 'subscriber': request.user.id}
         author = User.objects.filter(pk=pk).first()
         subscriber = request.user
+        subscriber.lock()
         if request.method == 'POST':
             serializer = serializers.SubscribeSerializer(data=data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            author.is_subscribed = True
             serializer = serializers.UserSerializer(
                 instance=author, context={'request': request}
             )
@@ -103,9 +145,59 @@ class UserViewSet(
             ).delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False, methods=['post', 'delete'], url_path='subscribe/batch'
+    )
+    @transaction.atomic
+    def subscribe_batch(self, request):
+        serializer = serializers.BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        found = set(
+            User.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if request.method == 'POST':
+            changed = Subscription.objects.add_authors(request.user, found)
+            statuses = ('created', 'exists')
+        else:
+            changed = Subscription.objects.remove_authors(request.user, found)
+            statuses = ('deleted', 'absent')
+        return Response({'results': batch_results(
+            ids, found, changed, *statuses, invalid={request.user.id}
+        )})
+
     @action(detail=False, methods=['get'])
     def subscriptions(self, request):
-        params = request.query_params.get(
+        context = self._get_subscriptions_context()
+        page = self.paginate_queryset(self._get_subscriptions())
+        self._set_latest_recipes(page, models.Recipe.objects.latest_by_authors(
+            [author.id for author in page], context['recipes_limit']
+        ))
+        serializer = serializers.UserSubscribeSerializer(
+            page,
+            context=context,
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    async def asubscriptions(self, request):
+        context = self._get_subscriptions_context()
+        page = await self.apaginate_queryset(self._get_subscriptions())
+        # raw() в async ORM Django 4.1 нет, запрос выполняется в потоке
+        self._set_latest_recipes(page, await sync_to_async(list)(
+            models.Recipe.objects.latest_by_authors(
+                [author.id for author in page], context['recipes_limit']
+            )
+        ))
+        serializer = serializers.UserSubscribeSerializer(
+            page,
+            context=context,
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def _get_subscriptions_context(self):
+        params = self.request.query_params.get(
             'recipes_limit',
             settings.DEFAULT_PAGE_SIZE,
         )
@@ -114,46 +206,114 @@ class UserViewSet(
             context['recipes_limit'] = int(params)
         except ValueError:
             raise ValidationError({'message': 'recipes_limit не число'})
-        queryset = self.get_queryset()
-        queryset = queryset.filter(
-            author__subscriber=request.user
-        ).all()
-        page = self.paginate_queryset(queryset=queryset)
-        serializer = serializers.UserSubscribeSerializer(
-            page,
-            context=context,
-            many=True
-        )
-        return self.get_paginated_response(serializer.data)
+        return context
+
+    def _get_subscriptions(self):
+        return self.get_queryset().filter(
+            author__subscriber=self.request.user
+        ).order_by('-author__id')
 
+    def _set_latest_recipes(self, page, recipes):
+        latest_recipes = {author.id: [] for author in page}
+        for recipe in recipes:
+            latest_recipes[recipe.author_id].append(recipe)
+        for author in page:
+            author.latest_recipes = latest_recipes[author.id]
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+@method_decorator(catalogue_condition('tags'), name='list')
+@method_decorator(catalogue_condition('tags'), name='retrieve')
+@method_decorator(catalogue_condition('tags'), name='alist')
+@method_decorator(catalogue_condition('tags'), name='aretrieve')
+class TagViewSet(AsyncReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializer
     pagination_class = None
 
+    async def alist(self, request):
+        tags = [tag async for tag in self.filter_queryset(
+            self.get_queryset()
+        )]
+        return Response(self.get_serializer(tags, many=True).data)
+
+    async def aretrieve(self, request, pk=None):
+        return Response(self.get_serializer(await self.aget_object()).data)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+@method_decorator(catalogue_condition('ingredients'), name='list')
+@method_decorator(catalogue_condition('ingredients'), name='retrieve')
+@method_decorator(catalogue_condition('ingredients'), name='alist')
+@method_decorator(catalogue_condition('ingredients'), name='aretrieve')
+class IngredientViewSet(AsyncReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = models.Ingredient.objects.all()
     serializer_class = serializers.IngridientsSerializer
     pagination_class = None
 
-    def get_queryset(self):
-        queryset = models.Ingredient.objects
-        name = self.request.query_params.get('name')
-        if name:
-            queryset = queryset.filter(name__istartswith=name)
-        return queryset.all()
+    def list(self, request, *args, **kwargs):
+        return Response(ingredient_index.search(
+            request.query_params.get('name'),
+            self._get_limit(),
+            get_catalogue_version(request, 'ingredients'),
+        ))
 
+    async def alist(self, request):
+        return Response(await ingredient_index.asearch(
+            request.query_params.get('name'),
+            self._get_limit(),
+            get_catalogue_version(request, 'ingredients'),
+        ))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    async def aretrieve(self, request, pk=None):
+        return Response(self.get_serializer(await self.aget_object()).data)
+
+    def _get_limit(self):
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError({'message': 'limit не число'})
+        return max(0, min(limit, settings.INGREDIENT_SEARCH_MAX_LIMIT))
+
+
+@method_decorator(
+    catalogue_condition('recipes', anonymous_only=True), name='list'
+)
+@method_decorator(
+    catalogue_condition('recipes', anonymous_only=True), name='retrieve'
+)
+@method_decorator(
+    catalogue_condition('recipes', anonymous_only=True), name='alist'
+)
+@method_decorator(
+    catalogue_condition('recipes', anonymous_only=True), name='aretrieve'
+)
+class RecipeViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     pagination_class = RecipePagination
+    filter_backends = [RecipeFilterBackend]
+
+    @property
+    def paginator(self):
+        # Курсор задает хронологический порядок, а у поиска порядок
+        # по релевантности, поэтому с search курсор не используется
+        params = self.request.query_params
+        if (
+            not hasattr(self, '_paginator')
+            and RecipeCursorPagination.cursor_query_param in params
+            and not params.get('search')
+        ):
+            self._paginator = RecipeCursorPagination()
+        return super().paginator
 
     def get_permissions(self):
         if self.action in (
             'shopping_cart',
             'favorite',
-            'download_shopping_cart'
+            'download_shopping_cart',
+            'shopping_list',
+            'shopping_cart_batch',
+            'favorite_batch',
         ):
             return [permissions.IsAuthenticated()]
         if self.action == 'destroy':
@@ -171,11 +331,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = models.Recipe.objects.select_related(
-            'author').prefetch_related('tags', 'ingredients')
-        queryset = queryset.annotate_quryset(user)
-        queryset = recipe_queryset_fiter(queryset, self.request)
-        return queryset
+        queryset = models.Recipe.objects.select_related('author')
+        return queryset.annotate_quryset(user)
+
+    async def alist(self, request):
+        page = await self.apaginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        serializer = self.get_serializer(page, many=True)
+        await serializer.child.aload(page)
+        return self.get_paginated_response(serializer.data)
+
+    async def aretrieve(self, request, pk=None):
+        recipe = await self.aget_object()
+        serializer = self.get_serializer(recipe)
+        await serializer.aload([recipe])
+        return Response(serializer.data)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -188,10 +359,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk=None):
         return self._shopping_cart_favoite(pk, models.Favorites)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/batch',
+    )
+    def shopping_cart_batch(self, request):
+        return self._batch(request, models.ShoppingCart)
+
+    @action(
+        detail=False, methods=['post', 'delete'], url_path='favorite/batch'
+    )
+    def favorite_batch(self, request):
+        return self._batch(request, models.Favorites)
+
+    @transaction.atomic
+    def _batch(self, request, Klass):
+        serializer = serializers.BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        found = set(models.Recipe.objects.filter(
+            id__in=ids
+        ).values_list('id', flat=True))
+        if request.method == 'POST':
+            changed = Klass.objects.add_recipes(request.user, found)
+            statuses = ('created', 'exists')
+        else:
+            changed = Klass.objects.remove_recipes(request.user, found)
+            statuses = ('deleted', 'absent')
+        return Response(
+            {'results': batch_results(ids, found, changed, *statuses)}
+        )
+
+    @transaction.atomic
     def _shopping_cart_favoite(self, pk, Klass):
         data = {'recipe': pk, 'user': self.request.user.id}
         item = models.Recipe.objects.filter(pk=data['recipe']).first()
         user = self.request.user
+        user.lock()
         if self.request.method == 'POST':
             serializer = self.get_serializer(data=data)
             serializer.is_valid(raise_exception=True)
@@ -206,20 +411,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
             Klass.objects.filter(user=user, recipe=item).delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, methods=['get'])
+    @action(
+        detail=False,
+        methods=['get'],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
+    )
     def download_shopping_cart(self, request):
-        name = 'ingredient__name'
-        unit = 'ingredient__measurement_unit'
-        ingredients = models.IngredientInRecipe.objects.select_related(
-            'recipe',
+        # Django 4.1 под ASGI читает тело потокового ответа в цикле событий,
+        # где обращаться к базе нельзя, поэтому файл собирается сразу
+        return shopping_list_response(
+            request.user,
+            request.accepted_renderer.format,
+            stream=not isinstance(request._request, ASGIRequest),
+        )
+
+    @action(detail=False, methods=['get'])
+    def shopping_list(self, request):
+        items = models.ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            '-total_amount',
+            'ingredient__name',
+            'ingredient__measurement_unit',
             'ingredient',
-        ).filter(recipe__shopping_cart__user=request.user)
-        ingredients = ingredients.values(
-            name,
-            unit,
-        ).annotate(total=Sum('amount')).order_by('-total')
-        catalog = '\n'.join(f'{item[name]} - {item["total"]} {item[unit]}'
-                            for item in ingredients) + settings.FILE_MESSAGE
-        response = HttpResponse(catalog, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="text.txt"'
-        return response
+        )
+        serializer = serializers.ShoppingListItemSerializer(items, many=True)
+        return Response(serializer.data)
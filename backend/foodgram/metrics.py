@@ -0,0 +1,110 @@
+"""Метрики Prometheus.
+
+Если задана переменная PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py задает
+ее воркерам), prometheus_client хранит значения в файлах этого каталога,
+и /api/metrics собирает их со всех процессов gunicorn. Без нее метрики
+живут в памяти процесса.
+"""
+import atexit
+import os
+import resource
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # Метрики без меток открывают файл сразу при создании, а каталог мог
+    # еще не появиться, если процесс запущен не через gunicorn
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    # Файлы liveall умершего процесса иначе убирает только child_exit
+    # gunicorn
+    atexit.register(
+        lambda: multiprocess.mark_process_dead(os.getpid())
+    )
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUESTS = Counter(
+    'foodgram_requests',
+    'Запросы по обработчикам и статусам',
+    ['view', 'method', 'status'],
+)
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса',
+    ['view'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'foodgram_request_db_queries',
+    'SQL-запросов на запрос',
+    ['view'],
+    buckets=QUERY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'foodgram_request_db_duration_seconds',
+    'Время SQL-запросов на запрос',
+    ['view'],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_response_size_bytes',
+    'Размер тела ответа, у потоковых ответов не считается',
+    ['view'],
+    buckets=SIZE_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    'foodgram_cache_lookups',
+    'Обращения к кешам: result - hit, shared_hit или miss',
+    ['cache', 'result'],
+)
+WORKER_MEMORY = Gauge(
+    'foodgram_worker_memory_bytes',
+    'Резидентная память процесса',
+    multiprocess_mode='liveall',
+)
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def get_memory_usage():
+    """Текущий RSS процесса, без /proc - пиковый."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def observe_request(view, method, status, duration, queries, db_duration,
+                    size):
+    view = view or 'unresolved'
+    REQUESTS.labels(view, method, status).inc()
+    REQUEST_DURATION.labels(view).observe(duration)
+    DB_QUERIES.labels(view).observe(queries)
+    DB_DURATION.labels(view).observe(db_duration)
+    if size is not None:
+        RESPONSE_SIZE.labels(view).observe(size)
+    WORKER_MEMORY.set(get_memory_usage())
+
+
+def count_cache_lookups(cache, hits=0, misses=0, shared_hits=0):
+    for result, count in (('hit', hits), ('shared_hit', shared_hits),
+                          ('miss', misses)):
+        if count:
+            CACHE_LOOKUPS.labels(cache, result).inc(count)
+
+
+def render_metrics():
+    """Тело ответа и Content-Type для /api/metrics."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.SlowQueryMiddleware',
+    'api.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +94,19 @@ DATABASES = {
     }
 }
 
+# Кеш рецептов сбрасывается сигналами только в своем процессе: кеш в памяти
+# (по умолчанию) годится для одного процесса gunicorn, с несколькими
+# процессами нужен общий кеш, например Redis
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -145,9 +160,9 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.AsyncPageNumberPagination',
     'PAGE_SIZE': 10
 }
 
@@ -162,6 +177,77 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Замеры запросов (api.middleware): доля запросов с Server-Timing и
+# строкой в логе api.timing
+
+REQUEST_TIMING_SAMPLE_RATE = float(
+    os.getenv('REQUEST_TIMING_SAMPLE_RATE', 0.05)
+)
+
+# Метрики Prometheus (foodgram.metrics), /api/metrics доступен сотрудникам
+# и запросам из перечисленных сетей
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128'
+).split(',')
+
+# Асинхронные GET рецептов, тегов, ингредиентов и подписок
+# (api.async_views). Включаются вместе с запуском под ASGI: под WSGI они
+# только медленнее, а под ASGI выигрывают, когда запросы к базе долгие
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Медленные SQL-запросы (api.middleware.SlowQueryMiddleware): порог в мс,
+# 0 - не отслеживать, сколько последних записей хранить для админки
+# и писать ли значения параметров запросов
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+SLOW_QUERY_LOG_SIZE = int(os.getenv('SLOW_QUERY_LOG_SIZE', 500))
+SLOW_QUERY_LOG_PARAMS = os.getenv('SLOW_QUERY_LOG_PARAMS', 'False') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'api.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Кеш токенов (users.authentication)
+
+TOKEN_CACHE_TTL = 10
+TOKEN_CACHE_MAX_SIZE = 10000
+# Дополнительно хранить токены в общем кеше CACHES, имеет смысл с Redis
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', 'False') == 'True'
+TOKEN_CACHE_SHARED_TTL = 5 * 60
+
+# Загрузка картинок рецептов
+
+IMAGE_UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_UPLOAD_MAX_MEGAPIXELS = 24
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+# Картинка приходит в JSON в base64, это на треть больше самого файла
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 1024 * 1024
+
+# Копии картинок рецептов (recipes.renditions): размер - ширина в пикселях
+IMAGE_RENDITIONS = {'thumbnail': 160, 'card': 640, 'full': 1280}
+IMAGE_RENDITION_QUALITY = 80
+# 0 - строить копии в фоновом потоке, без пула процессов
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
+
 # CORS
 
 CORS_ALLOW_CREDENTIALS = True
@@ -171,4 +257,24 @@ CORS_URLS_REGEX = r'^/api/.*$'
 # other settings
 
 FILE_MESSAGE = '\n\nfrom foodgram with love'
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+BATCH_MAX_SIZE = 100
 DEFAULT_PAGE_SIZE = 5
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+RECIPE_CACHE_TIMEOUT = 60 * 60
+# Увеличить при изменении формата RecipeSerializer
+RECIPE_CACHE_VERSION = 2
+INGREDIENT_INDEX_REFRESH_INTERVAL = 30
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+
+# Максимальное число SQL-запросов на эндпоинт, включая аутентификацию
+# (manage.py check_query_budget)
+
+QUERY_BUDGETS = {
+    '/api/recipes/': 6,
+    '/api/recipes/?search=budget': 6,
+    '/api/recipes/{recipe_id}/': 5,
+    '/api/users/': 3,
+    '/api/users/subscriptions/': 4,
+}
@@ -0,0 +1,22 @@
+"""Настройки gunicorn, подхватываются из рабочего каталога автоматически."""
+import os
+import shutil
+
+# Воркеры пишут метрики в файлы этого каталога (foodgram.metrics). Каталог
+# задается только здесь: manage.py и другие процессы держат метрики в
+# памяти и не оставляют файлов. prometheus_client выбирает режим при
+# импорте, поэтому в этом файле он импортируется только внутри хуков
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+
+def on_starting(server):
+    # Метрики прошлого запуска не должны смешиваться с новыми
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import mark_safe
 
 from .models import (Favorites, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag, get_recipe_amounts)
+from .renditions import get_image_urls
 
 
 class IngredientInline(admin.TabularInline):
@@ -18,7 +19,8 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'text',
         'picture',
-        'count_favorites'
+        'count_favorites',
+        'shopping_cart_count',
     )
     search_fields = ('name', 'author', 'tags')
     list_filter = ('name', 'author', 'tags',)
@@ -27,13 +29,24 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInline,)
     list_display_links = ('name',)
 
+    def save_related(self, request, form, formsets, change):
+        recipe_id = form.instance.id
+        old_amounts = get_recipe_amounts(recipe_id)
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.change_recipe(recipe_id, old_amounts)
+
     def count_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     count_favorites.short_description = 'В избранном'
 
     def picture(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="80" hieght="80"')
+        urls = get_image_urls(obj)
+        if urls is None:
+            return None
+        return mark_safe(
+            f'<img src="{urls["thumbnail"]["jpeg"]}" width="80">'
+        )
 
     picture.short_description = 'Изображение'
 
@@ -48,6 +61,6 @@ class IngredientAdmin(admin.ModelAdmin):
 admin.site.register(Tag)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(IngredientInRecipe)
 admin.site.register(ShoppingCart)
 admin.site.register(Favorites)
+admin.site.register(ShoppingListItem)
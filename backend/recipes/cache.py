@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.metrics import count_cache_lookups
+
+
+def recipe_cache_key(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def _found_fragments(recipe_ids, fragments):
+    found = {
+        recipe_id: fragments[recipe_cache_key(recipe_id)]
+        for recipe_id in recipe_ids
+        if recipe_cache_key(recipe_id) in fragments
+    }
+    count_cache_lookups(
+        'recipe', hits=len(found), misses=len(recipe_ids) - len(found)
+    )
+    return found
+
+
+def get_recipe_fragments(recipe_ids):
+    """Возвращает закешированные части рецептов, не зависящие от пользователя.
+
+    Ключ словаря - id рецепта, для отсутствующих в кеше ключа нет.
+    """
+    return _found_fragments(recipe_ids, cache.get_many(
+        [recipe_cache_key(recipe_id) for recipe_id in recipe_ids],
+        version=settings.RECIPE_CACHE_VERSION,
+    ))
+
+
+async def aget_recipe_fragments(recipe_ids):
+    return _found_fragments(recipe_ids, await cache.aget_many(
+        [recipe_cache_key(recipe_id) for recipe_id in recipe_ids],
+        version=settings.RECIPE_CACHE_VERSION,
+    ))
+
+
+def set_recipe_fragments(fragments):
+    cache.set_many(
+        {
+            recipe_cache_key(recipe_id): fragment
+            for recipe_id, fragment in fragments.items()
+        },
+        timeout=settings.RECIPE_CACHE_TIMEOUT,
+        version=settings.RECIPE_CACHE_VERSION,
+    )
+
+
+async def aset_recipe_fragments(fragments):
+    await cache.aset_many(
+        {
+            recipe_cache_key(recipe_id): fragment
+            for recipe_id, fragment in fragments.items()
+        },
+        timeout=settings.RECIPE_CACHE_TIMEOUT,
+        version=settings.RECIPE_CACHE_VERSION,
+    )
+
+
+def invalidate_recipes(recipe_ids):
+    cache.delete_many(
+        [recipe_cache_key(recipe_id) for recipe_id in recipe_ids],
+        version=settings.RECIPE_CACHE_VERSION,
+    )
+
+
+class PendingInvalidation:
+    """Рецепты и разделы каталога, которые сбросятся после коммита."""
+
+    def __init__(self):
+        self.recipe_ids = set()
+        self.sections = set()
+        self.done = False
+
+    def __call__(self):
+        from .models import CatalogueVersion
+
+        self.done = True
+        invalidate_recipes(self.recipe_ids)
+        CatalogueVersion.bump(*sorted(self.sections))
+
+
+def invalidate_recipes_on_commit(recipe_ids, *sections):
+    """Сбрасывает кеш рецептов и версии разделов каталога после коммита.
+
+    Сброс внутри транзакции не помогает: параллельный запрос успевает
+    положить в кеш данные до коммита, и они живут RECIPE_CACHE_TIMEOUT.
+    По умолчанию поднимается версия раздела recipes. Вызовы в одной
+    транзакции копятся в один on_commit, так что версии поднимаются
+    один раз.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_invalidation', None)
+    # Колбэк пропадает из очереди после коммита и при откате точки
+    # сохранения, в которой он добавлен, - тогда нужен новый
+    registered = (
+        pending is not None
+        and not pending.done
+        and any(item[1] is pending for item in connection.run_on_commit)
+    )
+    if not registered:
+        pending = connection.pending_invalidation = PendingInvalidation()
+    pending.recipe_ids.update(recipe_ids)
+    pending.sections.update(sections or ('recipes',))
+    if not registered:
+        transaction.on_commit(pending)
@@ -0,0 +1,28 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    """Число строк model, у которых field ссылается на внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by(
+            ).values(field).annotate(total=Count('pk')).values('total')
+        ),
+        0,
+    )
+
+
+def get_counters():
+    """Счетчики: (модель, поле счетчика, считаемая модель, ее поле-ссылка)."""
+    from users.models import Subscription, User
+
+    from .models import Favorites, Recipe, ShoppingCart
+
+    return (
+        (Recipe, 'favorites_count', Favorites, 'recipe'),
+        (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'subscribers_count', Subscription, 'author'),
+        (User, 'subscriptions_count', Subscription, 'subscriber'),
+    )
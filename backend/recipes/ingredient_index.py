@@ -0,0 +1,88 @@
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся в нижнем регистре (casefold) в отсортированном списке,
+    совпадения по префиксу ищутся бинарным поиском, совпадения по подстроке
+    добавляются после них. Индекс перестраивается при изменении версии
+    раздела ingredients в CatalogueVersion, которая проверяется не чаще
+    раза в INGREDIENT_INDEX_REFRESH_INTERVAL секунд. Если запрос уже знает
+    версию (из нее построен ETag), индекс сверяется с ней сразу, иначе
+    под новым ETag ушел бы старый список.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = ([], [])
+        self._version = None
+        self._checked_at = None
+
+    def mark_stale(self):
+        self._checked_at = None
+
+    def search(self, query=None, limit=None, version=None):
+        keys, items = self._get_data(version)
+        if not query:
+            return items[:limit]
+        query = query.casefold()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\U0010ffff', lo=start)
+        found = items[start:end]
+        if limit is None or len(found) < limit:
+            found = found + [
+                item for key, item in zip(keys, items)
+                if query in key and not key.startswith(query)
+            ]
+        return found[:limit]
+
+    async def asearch(self, query=None, limit=None, version=None):
+        """search для асинхронных представлений.
+
+        Проверка версии и перестройка индекса идут в потоке под той же
+        блокировкой, сам поиск - в памяти.
+        """
+        if self._is_stale(time.monotonic(), version):
+            await sync_to_async(self._get_data)(version)
+        return self.search(query, limit, version)
+
+    def _is_stale(self, now, version=None):
+        if version is not None:
+            return version != self._version
+        interval = settings.INGREDIENT_INDEX_REFRESH_INTERVAL
+        return self._checked_at is None or now - self._checked_at > interval
+
+    def _get_data(self, version=None):
+        now = time.monotonic()
+        if self._is_stale(now, version):
+            with self._lock:
+                if self._is_stale(now, version):
+                    self._refresh(now, version)
+        return self._data
+
+    def _refresh(self, now, version=None):
+        from .models import CatalogueVersion, Ingredient
+
+        if version is None:
+            version = CatalogueVersion.objects.filter(
+                name='ingredients'
+            ).values_list('version', flat=True).first()
+        if self._checked_at is not None and version == self._version:
+            self._checked_at = now
+            return
+        rows = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].casefold(), item['id']),
+        )
+        self._data = ([item['name'].casefold() for item in rows], rows)
+        self._version = version
+        self._checked_at = now
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,91 @@
+"""Загрузка справочника ингредиентов из CSV или JSON.
+
+Используется командой load_ingredients и миграцией 0002_add_ingredients,
+поэтому модель передается параметром.
+"""
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield {'name': row[0], 'measurement_unit': row[1]}
+
+
+def iter_json(file):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(JSON_CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] in ('', ']'):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Объект обрезан концом куска, дочитываем
+                break
+            yield item
+        buffer = buffer[position:]
+    if buffer.strip() not in ('', ']'):
+        raise ValueError('Некорректный JSON в конце файла')
+
+
+READERS = {'.csv': iter_csv, '.json': iter_json}
+
+
+def read_ingredients(path):
+    path = Path(path)
+    reader = READERS.get(path.suffix.lower())
+    if reader is None:
+        raise ValueError(f'Неизвестный формат файла: {path.suffix}')
+    with open(path, encoding='utf-8', newline='') as file:
+        for item in reader(file):
+            yield (
+                item['name'].strip(),
+                item['measurement_unit'].strip(),
+            )
+
+
+def upsert_ingredients(model, rows, batch_size=1000, dry_run=False):
+    """Добавляет отсутствующие ингредиенты пачками.
+
+    Ключ ингредиента - (name, measurement_unit), других полей у модели нет,
+    поэтому существующая строка всегда остается без изменений.
+    Возвращает {'inserted': ..., 'unchanged': ...}.
+    """
+    counts = {'inserted': 0, 'unchanged': 0}
+    rows = iter(rows)
+    while True:
+        batch = list(dict.fromkeys(islice(rows, batch_size)))
+        if not batch:
+            break
+        existing = set(model.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list('name', 'measurement_unit'))
+        new = [row for row in batch if row not in existing]
+        if new and not dry_run:
+            model.objects.bulk_create(
+                [
+                    model(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in new
+                ],
+                ignore_conflicts=True,
+            )
+        counts['inserted'] += len(new)
+        counts['unchanged'] += len(batch) - len(new)
+    return counts
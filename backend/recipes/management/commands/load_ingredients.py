@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.ingredient_index import ingredient_index
+from recipes.ingredient_loader import read_ingredients, upsert_ingredients
+from recipes.models import CatalogueVersion, Ingredient
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV (название,единица) или JSON '
+            '([{"name": ..., "measurement_unit": ...}]), добавляя '
+            'отсутствующие.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к .csv или .json')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Число строк в одном INSERT',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, ничего не записывая',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                counts = upsert_ingredients(
+                    Ingredient,
+                    read_ingredients(options['path']),
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                )
+                # bulk_create не отправляет сигналы
+                if counts['inserted'] and not options['dry_run']:
+                    CatalogueVersion.bump('ingredients')
+                    transaction.on_commit(ingredient_index.mark_stale)
+        except (OSError, ValueError, KeyError, IndexError) as error:
+            raise CommandError(f'Не удалось прочитать файл: {error!r}')
+        self.stdout.write(
+            f'Добавлено: {counts["inserted"]}, '
+            f'без изменений: {counts["unchanged"]}'
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from recipes.counters import count_subquery, get_counters
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики рецептов и '
+            'пользователей и списки покупок и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число расхождений',
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, counted_model, field in get_counters():
+            with transaction.atomic():
+                actual = count_subquery(counted_model, field)
+                drifted = model.objects.annotate(actual=actual).exclude(
+                    **{counter: F('actual')}
+                ).select_for_update()
+                ids = list(drifted.values_list('pk', flat=True))
+                if ids and not options['dry_run']:
+                    model.objects.filter(pk__in=ids).update(
+                        **{counter: actual}
+                    )
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: расхождений {len(ids)}'
+            )
+        with transaction.atomic():
+            changed = ShoppingListItem.objects.rebuild(
+                dry_run=options['dry_run']
+            )
+        self.stdout.write(f'shoppinglistitem: расхождений {changed}')
@@ -0,0 +1,51 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.renditions import render_image, save_renditions
+
+
+class Command(BaseCommand):
+    help = 'Строит копии картинок рецептов, у которых их еще нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии всех рецептов',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=max(settings.IMAGE_RENDITION_WORKERS, 1),
+            help='Число процессов',
+        )
+
+    def handle(self, *args, **options):
+        # Одна картинка может быть у нескольких рецептов
+        recipes = defaultdict(list)
+        for recipe_id, image, renditions in Recipe.objects.exclude(
+            image=''
+        ).values_list('id', 'image', 'renditions').iterator():
+            if options['all'] or renditions.get('source') != image:
+                recipes[image].append(recipe_id)
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=django.setup
+        ) as executor:
+            futures = {
+                executor.submit(render_image, image): image
+                for image in recipes
+            }
+            for future in as_completed(futures):
+                image = futures[future]
+                try:
+                    done += save_renditions(recipes[image], future.result())
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{image}: {error}')
+        self.stdout.write(f'Готово: {done}, ошибок: {failed}')
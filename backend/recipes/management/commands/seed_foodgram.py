@@ -0,0 +1,193 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes.models import (CatalogueVersion, Favorites, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart, Tag)
+from recipes.search import rebuild_search_index
+from users.models import Subscription, User
+
+WORDS = (
+    'борщ', 'суп', 'салат', 'пирог', 'каша', 'омлет', 'рагу', 'плов',
+    'блины', 'запеканка', 'котлеты', 'паста', 'соус', 'десерт', 'кекс',
+    'домашний', 'быстрый', 'летний', 'острый', 'сырный', 'овощной',
+    'куриный', 'грибной', 'рыбный', 'сладкий', 'бабушкин', 'постный',
+)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, корзинами и подписками для нагрузочных тестов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients', type=int, default=8,
+            help='Ингредиентов в рецепте',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Избранных рецептов у пользователя',
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в корзине у пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок у пользователя',
+        )
+        parser.add_argument(
+            '--images', type=int, default=5,
+            help='Разных картинок на все рецепты',
+        )
+        parser.add_argument(
+            '--password', default='foodgram-seed',
+            help='Пароль всех созданных пользователей',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        tags = list(Tag.objects.values_list('id', flat=True))
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not tags or len(ingredients) < options['ingredients']:
+            raise CommandError(
+                'Нужны теги и ингредиенты, сначала примените миграции'
+            )
+        with transaction.atomic():
+            users = self._create_users(options)
+            recipes = self._create_recipes(users, options)
+            self._create_relations(recipes, tags, ingredients, options)
+            self._create_user_recipes(users, recipes, options)
+            self._create_subscriptions(users, options)
+            # bulk_create не отправляет сигналы: пересчитываем счетчики,
+            # списки покупок и поисковый индекс, сбрасываем версии кеша
+            call_command('recount_counters', stdout=self.stdout)
+            rebuild_search_index()
+            CatalogueVersion.bump('recipes')
+        call_command('render_images', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}. '
+            f'Вход: {users[0].email if users else "-"} / '
+            f'{options["password"]}'
+        ))
+
+    def _bulk_create(self, model, objects):
+        """bulk_create, возвращающий id созданных строк на любой базе."""
+        last_id = model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        return list(model.objects.filter(id__gt=last_id).order_by('id'))
+
+    def _create_users(self, options):
+        password = make_password(options['password'])
+        start = User.objects.count()
+        return self._bulk_create(User, [
+            User(
+                email=f'seed{number}@example.com',
+                username=f'seed{number}',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(start, start + options['users'])
+        ])
+
+    def _create_images(self, count):
+        names = []
+        for number in range(count):
+            buffer = BytesIO()
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+            names.append(default_storage.save(
+                f'images/seed_{number}.jpg', ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def _create_recipes(self, users, options):
+        if not users:
+            return []
+        images = self._create_images(max(options['images'], 1))
+        return self._bulk_create(Recipe, [
+            Recipe(
+                author=self.random.choice(users),
+                name=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                text=' '.join(self.random.choices(WORDS, k=40)),
+                image=self.random.choice(images),
+                cooking_time=self.random.randint(5, 180),
+            )
+            for _ in range(options['recipes'])
+        ])
+
+    def _create_relations(self, recipes, tags, ingredients, options):
+        recipe_tag = Recipe.tags.through
+        recipe_tag.objects.bulk_create(
+            [
+                recipe_tag(recipe_id=recipe.id, tag_id=tag)
+                for recipe in recipes
+                for tag in self.random.sample(
+                    tags, self.random.randint(1, len(tags))
+                )
+            ],
+            batch_size=self.batch_size,
+        )
+        IngredientInRecipe.objects.bulk_create(
+            [
+                IngredientInRecipe(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in self.random.sample(
+                    ingredients, options['ingredients']
+                )
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def _create_user_recipes(self, users, recipes, options):
+        recipe_ids = [recipe.id for recipe in recipes]
+        for model, option in ((Favorites, 'favorites'),
+                              (ShoppingCart, 'cart')):
+            model.objects.bulk_create(
+                [
+                    model(user_id=user.id, recipe_id=recipe_id)
+                    for user in users
+                    for recipe_id in self.random.sample(
+                        recipe_ids, min(options[option], len(recipe_ids))
+                    )
+                ],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+
+    def _create_subscriptions(self, users, options):
+        author_ids = [user.id for user in users]
+        subscriptions = []
+        for user in users:
+            authors = self.random.sample(
+                author_ids, min(options['subscriptions'] + 1, len(users))
+            )
+            subscriptions += [
+                Subscription(subscriber_id=user.id, author_id=author_id)
+                for author_id in authors[:options['subscriptions']]
+                if author_id != user.id
+            ]
+        Subscription.objects.bulk_create(
+            subscriptions, batch_size=self.batch_size, ignore_conflicts=True
+        )
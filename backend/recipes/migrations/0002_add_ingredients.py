@@ -1,22 +1,21 @@
-import json
+from pathlib import Path
 
 from django.db import migrations
 
-with open('recipes/migrations/ingredients.json', 'r', encoding='utf-8') as f:
-    ingredients = json.load(f)
+from recipes.ingredient_loader import read_ingredients, upsert_ingredients
 
+INGREDIENTS_PATH = Path(__file__).resolve().parent / 'ingredients.json'
 
-def remove_ingredients(apps, schema_editor):
+
+def add_ingredients(apps, schema_editor):
     Ingredient = apps.get_model('recipes', 'Ingredient')
-    for ingredient in ingredients:
-        Ingredient.objects.get(name=ingredient['name']).delete()
+    upsert_ingredients(Ingredient, read_ingredients(INGREDIENTS_PATH))
 
 
-def add_ingredients(apps, schema_editor):
+def remove_ingredients(apps, schema_editor):
     Ingredient = apps.get_model('recipes', 'Ingredient')
-    for ingredient in ingredients:
-        new_ingredient = Ingredient(**ingredient)
-        new_ingredient.save()
+    names = {name for name, _ in read_ingredients(INGREDIENTS_PATH)}
+    Ingredient.objects.filter(name__in=names).delete()
 
 
 class Migration(migrations.Migration):
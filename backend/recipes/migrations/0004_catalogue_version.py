@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 01:37
+
+from django.db import migrations, models
+
+SECTIONS = ('tags', 'ingredients', 'recipes')
+
+
+def add_versions(apps, schema_editor):
+    CatalogueVersion = apps.get_model('recipes', 'CatalogueVersion')
+    CatalogueVersion.objects.bulk_create(
+        CatalogueVersion(name=name, version=1) for name in SECTIONS
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_add_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Раздел')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Версия каталога',
+                'verbose_name_plural': 'Версии каталога',
+            },
+        ),
+        migrations.RunPython(add_versions, migrations.RunPython.noop),
+    ]
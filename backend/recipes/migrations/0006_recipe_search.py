@@ -0,0 +1,57 @@
+from django.db import migrations
+
+POSTGRESQL_SCHEMA = (
+    "ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX recipe_search_idx ON recipes_recipe "
+    "USING GIN (search_vector)",
+)
+POSTGRESQL_SCHEMA_REVERSE = (
+    'DROP INDEX IF EXISTS recipe_search_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+    "name, text, tokenize='unicode61 remove_diacritics 2')",
+    'INSERT INTO recipes_recipe_fts(rowid, name, text) '
+    'SELECT id, name, text FROM recipes_recipe',
+)
+SQLITE_SCHEMA_REVERSE = ('DROP TABLE IF EXISTS recipes_recipe_fts',)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_SCHEMA
+    elif vendor == 'sqlite':
+        statements = SQLITE_SCHEMA
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_SCHEMA_REVERSE
+    elif vendor == 'sqlite':
+        statements = SQLITE_SCHEMA_REVERSE
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorites', 'recipe'),
+    ('recipes', 'Recipe', 'shopping_cart_count',
+     'recipes', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'subscribers_count', 'users', 'Subscription', 'author'),
+    ('users', 'User', 'subscriptions_count',
+     'users', 'Subscription', 'subscriber'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, counter, counted_app, counted_model, field in COUNTERS:
+        counted = apps.get_model(counted_app, counted_model).objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(total=Count('pk'))
+        apps.get_model(app, model).objects.update(
+            **{counter: Coalesce(Subquery(counted.values('total')), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_search'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
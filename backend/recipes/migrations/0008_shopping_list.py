@@ -0,0 +1,52 @@
+# Generated by Django 4.1.7 on 2026-10-18 01:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    totals = IngredientInRecipe.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values('recipe__shopping_cart__user', 'ingredient').annotate(
+        total=Sum('amount')
+    ).order_by()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=row['recipe__shopping_cart__user'],
+            ingredient_id=row['ingredient'],
+            total_amount=row['total'],
+        ) for row in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_user_ingredient'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
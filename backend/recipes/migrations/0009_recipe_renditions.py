@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shopping_list'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Копии картинки'),
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import Exists, OuterRef, Value
+from django.db.models import (Case, Exists, F, OuterRef, Prefetch, Sum, Value,
+                              When, Window)
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -60,6 +63,34 @@ class RecipQuerySet(models.QuerySet):
             )) if user.is_authenticated else Value(False)
         )
 
+    def latest_by_authors(self, authors, limit):
+        ranked = self.filter(author__in=authors).annotate(
+            recipe_rank=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).order_by().values(
+            'id', 'author', 'name', 'image', 'cooking_time', 'recipe_rank'
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            'ORDER BY author_id, recipe_rank',
+            (*params, limit),
+        )
+
+
+def recipe_prefetches():
+    """Связи рецепта, которые нужны для его сериализации."""
+    return (
+        'tags',
+        Prefetch(
+            'ingredientinrecipe_set',
+            queryset=IngredientInRecipe.objects.select_related('ingredient'),
+        ),
+    )
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(
@@ -93,16 +124,58 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+    renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Копии картинки',
+    )
     objects = RecipQuerySet.as_manager()
 
+    # Меняются только через F() в сигналах и manage.py recount_counters
+    COUNTER_FIELDS = ('favorites_count', 'shopping_cart_count')
+    # Заполняется в фоне (recipes.renditions), save() его не перезаписывает
+    BACKGROUND_FIELDS = ('renditions',)
+
     class Meta():
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
+        indexes = [
+            models.Index(
+                fields=('-pub_date', 'id'),
+                name='recipe_feed_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_feed_idx',
+            ),
+        ]
+
     def __str__(self):
         return f'Рецепт "{self.name}" автора "{self.author.username}"'
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.name not in self.BACKGROUND_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class IngredientInRecipe(models.Model):
     ingredient = models.ForeignKey(
@@ -138,6 +211,76 @@ class IngredientInRecipe(models.Model):
                 f'{self.ingredient.measurement_unit} {self.ingredient.name}')
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    """Пакетное добавление и удаление рецептов в избранном или корзине.
+
+    Счетчик рецепта (COUNTER_FIELD модели) обновляется здесь же одним
+    UPDATE, а не сигналами на каждую строку. Методы вызываются внутри
+    transaction.atomic: пользователь блокируется до конца транзакции.
+    """
+
+    # Сигналы удаления пропускают запросы, которые сами обновляют счетчики
+    updates_counters = False
+
+    def add_recipes(self, user, recipe_ids):
+        """Добавляет рецепты, возвращает id действительно добавленных."""
+        user.lock()
+        existing = set(self.filter(
+            user=user, recipe__in=recipe_ids
+        ).values_list('recipe', flat=True))
+        added = [
+            recipe_id for recipe_id in dict.fromkeys(recipe_ids)
+            if recipe_id not in existing
+        ]
+        self.bulk_create(
+            [
+                self.model(user=user, recipe_id=recipe_id)
+                for recipe_id in added
+            ],
+            ignore_conflicts=True,
+        )
+        self._change_counter(added, 1)
+        return added
+
+    def remove_recipes(self, user, recipe_ids):
+        """Удаляет рецепты, возвращает id действительно удаленных."""
+        user.lock()
+        rows = self.filter(user=user, recipe__in=recipe_ids)
+        removed = list(rows.values_list('recipe', flat=True))
+        rows.updates_counters = True
+        rows.delete()
+        self._change_counter(removed, -1)
+        return removed
+
+    def _change_counter(self, recipe_ids, delta):
+        if recipe_ids:
+            counter = self.model.COUNTER_FIELD
+            Recipe.objects.filter(id__in=recipe_ids).update(
+                **{counter: Greatest(F(counter) + delta, Value(0))}
+            )
+
+
+class ShoppingCartQuerySet(UserRecipeQuerySet):
+
+    def add_recipes(self, user, recipe_ids):
+        added = super().add_recipes(user, recipe_ids)
+        self._change_shopping_list(user, added, 1)
+        return added
+
+    def remove_recipes(self, user, recipe_ids):
+        removed = super().remove_recipes(user, recipe_ids)
+        self._change_shopping_list(user, removed, -1)
+        return removed
+
+    def _change_shopping_list(self, user, recipe_ids, sign):
+        if recipe_ids:
+            ShoppingListItem.objects.change_amounts([user.id], {
+                ingredient: sign * amount
+                for ingredient, amount
+                in get_recipe_amounts(*recipe_ids).items()
+            })
+
+
 class Favorites(models.Model):
     user = models.ForeignKey(
         User,
@@ -151,6 +294,9 @@ class Favorites(models.Model):
         related_name='favorites',
         verbose_name='Рецепт',
     )
+    objects = UserRecipeQuerySet.as_manager()
+
+    COUNTER_FIELD = 'favorites_count'
 
     class Meta():
         verbose_name = 'Избранный рецепт'
@@ -178,6 +324,9 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт',
     )
+    objects = ShoppingCartQuerySet.as_manager()
+
+    COUNTER_FIELD = 'shopping_cart_count'
 
     class Meta():
         verbose_name = 'Корзина'
@@ -192,3 +341,175 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'Рецепт "{self.recipe.name}" в корзине {self.user.username}'
+
+
+def get_recipe_amounts(*recipe_ids):
+    """Ингредиенты рецептов: {id ингредиента: суммарное количество}."""
+    return dict(IngredientInRecipe.objects.filter(
+        recipe__in=recipe_ids
+    ).values('ingredient').annotate(
+        total=Sum('amount')
+    ).order_by().values_list('ingredient', 'total'))
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def change_amounts(self, users, deltas):
+        """Прибавляет deltas {id ингредиента: количество} к спискам users."""
+        deltas = {
+            ingredient: delta for ingredient, delta in deltas.items() if delta
+        }
+        users = list(users)
+        if not deltas or not users:
+            return
+        self.bulk_create(
+            [
+                ShoppingListItem(user_id=user, ingredient_id=ingredient)
+                for user in users
+                for ingredient, delta in deltas.items()
+                if delta > 0
+            ],
+            ignore_conflicts=True,
+        )
+        items = self.filter(user__in=users, ingredient__in=deltas)
+        items.update(total_amount=Greatest(
+            F('total_amount') + Case(
+                *[
+                    When(ingredient=ingredient, then=Value(delta))
+                    for ingredient, delta in deltas.items()
+                ],
+                default=Value(0),
+            ),
+            Value(0),
+        ))
+        items.filter(total_amount=0).delete()
+
+    def add_recipe(self, users, recipe_id, sign=1):
+        """Добавляет (sign=-1 - убирает) ингредиенты рецепта в списки users."""
+        self.change_amounts(users, {
+            ingredient: sign * amount
+            for ingredient, amount in get_recipe_amounts(recipe_id).items()
+        })
+
+    def change_recipe(self, recipe_id, old_amounts):
+        """Переносит в корзины изменение ингредиентов рецепта.
+
+        old_amounts - {id ингредиента: количество} до изменения.
+        """
+        users = list(ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user', flat=True))
+        if not users:
+            return
+        new_amounts = get_recipe_amounts(recipe_id)
+        self.change_amounts(users, {
+            ingredient: new_amounts.get(ingredient, 0)
+            - old_amounts.get(ingredient, 0)
+            for ingredient in old_amounts.keys() | new_amounts.keys()
+        })
+
+    def rebuild(self, dry_run=False):
+        """Пересчитывает все списки из корзин, возвращает число изменений."""
+        actual = {
+            (row['recipe__shopping_cart__user'], row['ingredient']):
+                row['total']
+            for row in IngredientInRecipe.objects.filter(
+                recipe__shopping_cart__isnull=False
+            ).values('recipe__shopping_cart__user', 'ingredient').annotate(
+                total=Sum('amount')
+            ).order_by()
+        }
+        stored = {
+            (user, ingredient): total
+            for user, ingredient, total in self.values_list(
+                'user', 'ingredient', 'total_amount'
+            )
+        }
+        changed = {
+            key for key in actual.keys() | stored.keys()
+            if actual.get(key) != stored.get(key)
+        }
+        if dry_run:
+            return len(changed)
+        for user, ingredient in changed - actual.keys():
+            self.filter(user=user, ingredient=ingredient).delete()
+        self.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user, ingredient_id=ingredient, total_amount=total
+                )
+                for (user, ingredient), total in actual.items()
+                if (user, ingredient) in changed
+            ],
+            update_conflicts=True,
+            unique_fields=('user', 'ingredient'),
+            update_fields=('total_amount',),
+        )
+        return len(changed)
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество',
+    )
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta():
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Списки покупок'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_user_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return (f'{self.ingredient.name} - {self.total_amount} '
+                f'{self.ingredient.measurement_unit} у {self.user.username}')
+
+
+class CatalogueVersion(models.Model):
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name='Раздел',
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия',
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения',
+    )
+
+    class Meta():
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = 'Версии каталога'
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+    @classmethod
+    def bump(cls, *names):
+        for name in names:
+            updated = cls.objects.filter(name=name).update(
+                version=models.F('version') + 1,
+                updated=timezone.now(),
+            )
+            if not updated:
+                cls.objects.get_or_create(name=name, defaults={'version': 1})
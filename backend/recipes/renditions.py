@@ -0,0 +1,256 @@
+"""Уменьшенные копии картинок рецептов.
+
+Копии строятся в пуле процессов (при IMAGE_RENDITION_WORKERS=0 - в
+фоновом потоке) после коммита транзакции, поэтому запрос не ждет Pillow.
+Пути к готовым файлам сохраняются в Recipe.renditions вместе с именем
+исходной картинки: пока оно не совпадает с текущей картинкой рецепта,
+отдается оригинал. На SQLite запись из служебного потока ломает
+транзакции идущих запросов ошибкой "database is locked", поэтому копии,
+готовые во время запроса, записывает поток запроса после ответа
+(finish_request), а в простое процесса - сам служебный поток.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import (BrokenExecutor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'renditions'
+# Формат Pillow и расширение файла
+RENDITION_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+_executor = None
+_executor_lock = threading.Lock()
+# Готовые копии, которые на SQLite ждут записи: (id рецепта, копии)
+_pending = deque()
+# Запросы, которые сейчас обрабатывает процесс
+_active_requests = 0
+_requests_lock = threading.Lock()
+
+
+def render_image(source):
+    """Строит все копии картинки source из хранилища.
+
+    Выполняется в отдельном процессе и не обращается к базе.
+    Возвращает {'source': source, размер: {формат: путь}}.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    with default_storage.open(source) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        renditions = {'source': source}
+        for size, width in settings.IMAGE_RENDITIONS.items():
+            copy = image.copy()
+            copy.thumbnail((width, image.height), Image.LANCZOS)
+            renditions[size] = {}
+            for extension, image_format in RENDITION_FORMATS.items():
+                buffer = BytesIO()
+                copy.save(
+                    buffer,
+                    image_format,
+                    quality=settings.IMAGE_RENDITION_QUALITY,
+                )
+                name = f'{RENDITIONS_DIR}/{stem}_{size}.{extension}'
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                renditions[size][extension] = default_storage.save(
+                    name, ContentFile(buffer.getvalue())
+                )
+    return renditions
+
+
+def save_renditions(recipe_ids, renditions):
+    """Записывает копии рецептам, у которых картинка не сменилась.
+
+    Файлы прежних копий удаляются, если на них больше никто не ссылается.
+    Возвращает число обновленных рецептов.
+    """
+    from .cache import invalidate_recipes_on_commit
+    from .models import Recipe
+
+    recipes = Recipe.objects.filter(
+        id__in=recipe_ids, image=renditions['source']
+    )
+    previous = list(recipes.values_list('renditions', flat=True))
+    updated = recipes.update(renditions=renditions)
+    if updated:
+        invalidate_recipes_on_commit(recipe_ids)
+        transaction.on_commit(
+            lambda: delete_renditions(previous, keep=renditions)
+        )
+    return updated
+
+
+def _get_paths(renditions):
+    return {
+        path
+        for size in settings.IMAGE_RENDITIONS
+        for path in renditions.get(size, {}).values()
+    }
+
+
+def delete_renditions(old_renditions, keep):
+    """Удаляет файлы старых копий, кроме копий keep и чужих рецептов.
+
+    Одна картинка бывает у нескольких рецептов, поэтому копии исходника,
+    который еще записан у какого-то рецепта, остаются.
+    """
+    from .models import Recipe
+
+    stale = set()
+    sources = set()
+    for renditions in old_renditions:
+        stale |= _get_paths(renditions)
+        sources.add(renditions.get('source'))
+    stale -= _get_paths(keep)
+    sources -= {None, keep['source']}
+    if sources:
+        for renditions in Recipe.objects.filter(
+            renditions__source__in=sources
+        ).values_list('renditions', flat=True):
+            stale -= _get_paths(renditions)
+    for name in stale:
+        default_storage.delete(name)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if settings.IMAGE_RENDITION_WORKERS:
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.IMAGE_RENDITION_WORKERS,
+                    initializer=django.setup,
+                )
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='renditions'
+                )
+        return _executor
+
+
+def _reset_executor(executor):
+    """Убирает сломанный пул, следующая задача создаст новый."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _submit(source):
+    executor = get_executor()
+    try:
+        return executor, executor.submit(render_image, source)
+    except BrokenExecutor:
+        # Процесс пула умер (например, от нехватки памяти), и пул больше
+        # не принимает задачи
+        logger.warning('Пул копий картинок сломан, создается новый')
+        _reset_executor(executor)
+    executor = get_executor()
+    return executor, executor.submit(render_image, source)
+
+
+def start_request():
+    global _active_requests
+    with _requests_lock:
+        _active_requests += 1
+
+
+def finish_request():
+    """Записывает копии, отложенные на время запроса, после ответа."""
+    global _active_requests
+    with _requests_lock:
+        _active_requests = max(_active_requests - 1, 0)
+    save_pending_renditions()
+
+
+def save_pending_renditions():
+    """Записывает копии, отложенные на SQLite."""
+    while _pending:
+        recipe_id, renditions = _pending.popleft()
+        try:
+            save_renditions([recipe_id], renditions)
+        except Exception:
+            logger.exception(
+                'Не удалось сохранить копии рецепта %s', recipe_id
+            )
+
+
+# Копии, отложенные до конца запроса, не теряются и при выходе процесса
+atexit.register(save_pending_renditions)
+
+
+def _on_rendered(executor, recipe_id, future):
+    # Вызывается в служебном потоке пула со своим подключением к базе
+    try:
+        renditions = future.result()
+        if connection.vendor != 'sqlite':
+            save_renditions([recipe_id], renditions)
+            return
+        # Пока идет запись, новый запрос ждет в start_request
+        with _requests_lock:
+            if _active_requests:
+                _pending.append((recipe_id, renditions))
+            else:
+                save_renditions([recipe_id], renditions)
+    except BrokenExecutor:
+        _reset_executor(executor)
+        logger.exception('Пул копий картинок сломан, рецепт %s', recipe_id)
+    except Exception:
+        logger.exception('Не удалось построить копии рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe):
+    """Ставит построение копий в очередь после коммита транзакции."""
+    recipe_id, source = recipe.id, recipe.image.name
+    if not source:
+        return
+
+    def submit():
+        # Ошибка здесь превратила бы уже закоммиченный запрос в 500,
+        # а без копий рецепт просто отдает оригинал
+        try:
+            executor, future = _submit(source)
+        except Exception:
+            logger.exception(
+                'Не удалось поставить в очередь копии рецепта %s', recipe_id
+            )
+            return
+        future.add_done_callback(
+            lambda future: _on_rendered(executor, recipe_id, future)
+        )
+
+    transaction.on_commit(submit)
+
+
+def get_image_urls(recipe):
+    """URL копий картинки рецепта, пока копий нет - URL оригинала."""
+    if not recipe.image:
+        return None
+    renditions = recipe.renditions
+    ready = renditions.get('source') == recipe.image.name
+    return {
+        size: {
+            extension: (
+                default_storage.url(renditions[size][extension])
+                if ready and extension in renditions.get(size, {})
+                else recipe.image.url
+            )
+            for extension in RENDITION_FORMATS
+        }
+        for size in settings.IMAGE_RENDITIONS
+    }
@@ -0,0 +1,94 @@
+"""Полнотекстовый поиск рецептов по названию и описанию.
+
+PostgreSQL: генерируемая колонка recipes_recipe.search_vector (tsvector,
+русский стемминг, название весомее описания) с GIN-индексом, ее обновляет
+сама база. SQLite: таблица FTS5 recipes_recipe_fts, которая обновляется
+сигналами при сохранении и удалении рецепта.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def _fts_query(query):
+    """Запрос FTS5 из слов пользователя: все слова, каждое как префикс."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+def search_recipes(queryset, query):
+    """Оставляет рецепты, подходящие под запрос, и сортирует по релевантности.
+
+    Запрос без слов возвращает пустой queryset.
+    """
+    if not re.search(r'\w', query):
+        return queryset.none()
+    if connection.vendor != 'postgresql':
+        return _search_fts(queryset, _fts_query(query))
+    tsquery = "websearch_to_tsquery('russian', %s)"
+    matches = RawSQL(
+        f'"recipes_recipe"."search_vector" @@ {tsquery}',
+        (query,),
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        f'ts_rank("recipes_recipe"."search_vector", {tsquery})',
+        (query,),
+        output_field=FloatField(),
+    )
+    return queryset.filter(matches).annotate(search_rank=rank).order_by(
+        '-search_rank', '-pub_date', 'id'
+    )
+
+
+def _search_fts(queryset, query):
+    """Поиск SQLite: join с FTS5, MATCH выполняется один раз.
+
+    bm25 берется из той же строки индекса, а не подзапросом на каждый
+    найденный рецепт.
+    """
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = "recipes_recipe"."id"',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[query],
+        # bm25 тем меньше, чем документ релевантнее
+        select={'search_rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+    ).order_by('-search_rank', '-pub_date', 'id')
+
+
+def index_recipe(recipe):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe.id,))
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, name, text) VALUES (%s, %s, %s)',
+            (recipe.id, recipe.name, recipe.text),
+        )
+
+
+def unindex_recipe(recipe_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe_id,))
+
+
+def rebuild_search_index():
+    """Заново заполняет индекс SQLite, например после bulk_create рецептов."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+            'SELECT id, name, text FROM recipes_recipe'
+        )
@@ -0,0 +1,166 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .cache import invalidate_recipes_on_commit
+from .ingredient_index import ingredient_index
+from .models import (Favorites, Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingCart, ShoppingListItem, Tag)
+from .renditions import finish_request, schedule_renditions, start_request
+from .search import index_recipe, unindex_recipe
+
+User = get_user_model()
+
+# Поля пользователя, которые не попадают в закешированный рецепт
+USER_PRIVATE_FIELDS = {'password', 'last_login'}
+
+CATALOGUE_SECTIONS = {Tag: 'tags', Ingredient: 'ingredients'}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate_recipes_on_commit([instance.id])
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_index(sender, instance, **kwargs):
+    index_recipe(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def render_recipe_image(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields is None or 'image' in update_fields:
+        if instance.renditions.get('source') != instance.image.name:
+            schedule_renditions(instance)
+
+
+@receiver(request_started)
+def hold_rendered_images(sender, **kwargs):
+    start_request()
+
+
+@receiver(request_finished)
+def save_rendered_images(sender, **kwargs):
+    finish_request()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_recipe(instance.id)
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def invalidate_recipe_ingredient(sender, instance, **kwargs):
+    invalidate_recipes_on_commit([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_relations(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes_on_commit([instance.id])
+    elif action == 'pre_clear':
+        invalidate_recipes_on_commit(
+            instance.recipes.values_list('id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        invalidate_recipes_on_commit(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def invalidate_catalogue_item(sender, instance, created, **kwargs):
+    recipe_ids = (
+        [] if created else instance.recipes.values_list('id', flat=True)
+    )
+    invalidate_recipes_on_commit(
+        recipe_ids, CATALOGUE_SECTIONS[sender], 'recipes'
+    )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def invalidate_deleted_catalogue_item(sender, instance, **kwargs):
+    invalidate_recipes_on_commit(
+        instance.recipes.values_list('id', flat=True),
+        CATALOGUE_SECTIONS[sender], 'recipes',
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def refresh_ingredient_index(sender, **kwargs):
+    # До коммита другой поток перечитал бы старые строки
+    transaction.on_commit(ingredient_index.mark_stale)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields, **kwargs):
+    if created or (
+        update_fields and set(update_fields) <= USER_PRIVATE_FIELDS
+    ):
+        return
+    invalidate_recipes_on_commit(
+        instance.recipes.values_list('id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        counter = sender.COUNTER_FIELD
+        Recipe.objects.filter(id=instance.recipe_id).update(
+            **{counter: F(counter) + 1}
+        )
+
+
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, origin=None, **kwargs):
+    if getattr(origin, 'updates_counters', False):
+        return
+    counter = sender.COUNTER_FIELD
+    Recipe.objects.filter(
+        id=instance.recipe_id, **{f'{counter}__gt': 0}
+    ).update(**{counter: F(counter) - 1})
+
+
+@receiver(post_save, sender=Recipe)
+def increment_author_recipes(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(id=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_author_recipes(sender, instance, **kwargs):
+    User.objects.filter(
+        id=instance.author_id, recipes_count__gt=0
+    ).update(recipes_count=F('recipes_count') - 1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipe(
+            [instance.user_id], instance.recipe_id
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, origin=None, **kwargs):
+    if getattr(origin, 'updates_counters', False):
+        return
+    ShoppingListItem.objects.add_recipe(
+        [instance.user_id], instance.recipe_id, sign=-1
+    )
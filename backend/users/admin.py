@@ -12,7 +12,15 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('first_name', 'last_name', 'email', 'is_active')
         }),
     )
-    list_display = ('username', 'email', 'first_name', 'is_active',)
+    list_display = (
+        'username',
+        'email',
+        'first_name',
+        'is_active',
+        'recipes_count',
+        'subscribers_count',
+        'subscriptions_count',
+    )
     search_fields = ('first_name', 'email')
     list_filter = ('first_name', 'email',)
     empty_value_display = '-пусто-'
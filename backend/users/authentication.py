@@ -0,0 +1,242 @@
+"""Аутентификация по токену без запроса к базе на каждый запрос.
+
+Токен и несколько полей пользователя запоминаются в памяти процесса (LRU
+с TTL) и, если включен TOKEN_CACHE_SHARED, в общем кеше Django. Каждая
+запись помечена версией токена из кеша Django, которая прочитана до
+запроса к базе. Выход, смена пароля и любое изменение пользователя после
+коммита меняют версию, и записи во всех процессах перестают совпадать с
+ней. Для нескольких процессов нужен общий CACHE_BACKEND.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (TokenAuthentication,
+                                           get_authorization_header)
+from rest_framework.authtoken.models import Token
+
+from foodgram.metrics import count_cache_lookups
+
+from .models import User
+
+# Остальные поля, включая хеш пароля, в кеш не попадают и подгружаются
+# из базы при обращении. Имя и фамилия нужны автору в ответах на запись.
+# Model.from_db ждет значения в порядке полей модели.
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {
+        'id', 'email', 'username', 'first_name', 'last_name',
+        'is_active', 'is_staff',
+    }
+)
+TOKEN_FIELDS = tuple(field.attname for field in Token._meta.concrete_fields)
+
+
+def shared_cache_key(key):
+    return f'token-auth:{key}'
+
+
+def version_cache_key(key):
+    return f'token-auth-version:{key}'
+
+
+def get_token_version(key):
+    """Текущая версия токена, при первом обращении создается новая."""
+    version = cache.get(version_cache_key(key))
+    if version is None:
+        cache.add(version_cache_key(key), uuid.uuid4().hex, timeout=None)
+        version = cache.get(version_cache_key(key))
+    return version
+
+
+class TokenCache:
+    """Потокобезопасный LRU-кеш с ограниченным временем жизни записей."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                count_cache_lookups('token', hits=1)
+                return item[1]
+            self._items.pop(key, None)
+        if settings.TOKEN_CACHE_SHARED:
+            value = cache.get(shared_cache_key(key))
+            if value is not None:
+                self.shared_hits += 1
+                count_cache_lookups('token', shared_hits=1)
+                self._set_local(key, value)
+                return value
+        self.misses += 1
+        count_cache_lookups('token', misses=1)
+        return None
+
+    def set(self, key, value):
+        self._set_local(key, value)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.set(
+                shared_cache_key(key),
+                value,
+                timeout=settings.TOKEN_CACHE_SHARED_TTL,
+            )
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.delete_many([shared_cache_key(key) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+
+token_cache = TokenCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL
+)
+
+
+def invalidate_tokens(*keys):
+    """Сбрасывает записи токенов во всех процессах после коммита."""
+    def invalidate():
+        cache.set_many(
+            {version_cache_key(key): uuid.uuid4().hex for key in keys},
+            timeout=None,
+        )
+        token_cache.delete(*keys)
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(
+        *Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который берет токен и пользователя из кеша.
+
+    В кеше лежат значения полей, по ним каждый раз собираются новые
+    объекты, поэтому запросы не делят между собой request.user. Версия
+    токена читается до запроса к базе: если пользователя изменят, пока
+    запрос идет, запись уже не совпадет с новой версией.
+    aauthenticate - то же для асинхронных представлений (api.async_views).
+    """
+
+    def get_key(self, request):
+        """Токен из заголовка Authorization, None - другая схема."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. No credentials provided.')
+            )
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_(
+                'Invalid token header. '
+                'Token string should not contain spaces.'
+            ))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_(
+                'Invalid token header. '
+                'Token string should not contain invalid characters.'
+            ))
+
+    def authenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return self.authenticate_credentials(key)
+
+    async def aauthenticate(self, request):
+        key = self.get_key(request)
+        if key is None:
+            return None
+        credentials = self.get_cached_credentials(key)
+        if credentials is not None:
+            return credentials
+        version = get_token_version(key)
+        try:
+            token = await self.get_model().objects.select_related(
+                'user'
+            ).aget(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        self.cache_credentials(key, version, token.user, token)
+        return token.user, token
+
+    def authenticate_credentials(self, key):
+        credentials = self.get_cached_credentials(key)
+        if credentials is None:
+            version = get_token_version(key)
+            credentials = super().authenticate_credentials(key)
+            self.cache_credentials(key, version, *credentials)
+        return credentials
+
+    def get_cached_credentials(self, key):
+        snapshot = token_cache.get(key)
+        if snapshot is None:
+            return None
+        version, token_values, user_values = snapshot
+        if (
+            version is None
+            or len(user_values) != len(USER_FIELDS)
+            or version != cache.get(version_cache_key(key))
+        ):
+            token_cache.delete(key)
+            return None
+        user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, user_values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        token = Token.from_db(DEFAULT_DB_ALIAS, TOKEN_FIELDS, token_values)
+        token.user = user
+        return user, token
+
+    def cache_credentials(self, key, version, user, token):
+        token_cache.set(key, (
+            version,
+            tuple(getattr(token, field) for field in TOKEN_FIELDS),
+            tuple(getattr(user, field) for field in USER_FIELDS),
+        ))
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Greatest
 from django.utils.translation import gettext_lazy as _
 
 
@@ -14,13 +15,105 @@ class User(AbstractUser):
     first_name = models.CharField(_('first name'), max_length=150, blank=False)
     last_name = models.CharField(_('last name'), max_length=150, blank=False)
     email = models.EmailField(_('email address'), unique=True)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписок',
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    # Меняются только через F() в сигналах и manage.py recount_counters
+    COUNTER_FIELDS = ('recipes_count', 'subscribers_count',
+                      'subscriptions_count')
+
     def __str__(self):
         return self.first_name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def lock(self):
+        """Блокирует строку пользователя до конца транзакции.
+
+        Берется перед изменением его избранного, корзины и подписок, чтобы
+        параллельные запросы не посчитали одну строку дважды.
+        """
+        User.objects.select_for_update().only('pk').get(pk=self.pk)
+
+
+class SubscriptionQuerySet(models.QuerySet):
+    """Пакетная подписка и отписка, счетчики обновляются одним UPDATE.
+
+    Методы вызываются внутри transaction.atomic: подписчик блокируется до
+    конца транзакции.
+    """
+
+    # Сигналы удаления пропускают запросы, которые сами обновляют счетчики
+    updates_counters = False
+
+    def add_authors(self, subscriber, author_ids):
+        """Подписывает на авторов, возвращает id новых подписок."""
+        subscriber.lock()
+        existing = set(self.filter(
+            subscriber=subscriber, author__in=author_ids
+        ).values_list('author', flat=True))
+        added = [
+            author_id for author_id in dict.fromkeys(author_ids)
+            if author_id not in existing and author_id != subscriber.id
+        ]
+        self.bulk_create(
+            [
+                Subscription(author_id=author_id, subscriber=subscriber)
+                for author_id in added
+            ],
+            ignore_conflicts=True,
+        )
+        self._change_counters(subscriber, added, 1)
+        return added
+
+    def remove_authors(self, subscriber, author_ids):
+        """Отписывает от авторов, возвращает id удаленных подписок."""
+        subscriber.lock()
+        rows = self.filter(subscriber=subscriber, author__in=author_ids)
+        removed = list(rows.values_list('author', flat=True))
+        rows.updates_counters = True
+        rows.delete()
+        self._change_counters(subscriber, removed, -1)
+        return removed
+
+    def _change_counters(self, subscriber, author_ids, sign):
+        if not author_ids:
+            return
+        User.objects.filter(id__in=author_ids).update(
+            subscribers_count=Greatest(
+                models.F('subscribers_count') + sign, models.Value(0)
+            )
+        )
+        User.objects.filter(id=subscriber.id).update(
+            subscriptions_count=Greatest(
+                models.F('subscriptions_count') + sign * len(author_ids),
+                models.Value(0),
+            )
+        )
+
 
 class Subscription(models.Model):
     author = models.ForeignKey(
@@ -35,6 +128,7 @@ class Subscription(models.Model):
         related_name='subscriber',
         verbose_name='Подписчик',
     )
+    objects = SubscriptionQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Подписка'
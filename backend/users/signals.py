@@ -0,0 +1,43 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens, invalidate_user_tokens
+from .models import Subscription, User
+
+
+@receiver(post_save, sender=Subscription)
+def increment_subscription_counters(sender, instance, created, **kwargs):
+    if not created:
+        return
+    User.objects.filter(id=instance.author_id).update(
+        subscribers_count=F('subscribers_count') + 1
+    )
+    User.objects.filter(id=instance.subscriber_id).update(
+        subscriptions_count=F('subscriptions_count') + 1
+    )
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_subscription_counters(sender, instance, origin=None, **kwargs):
+    if getattr(origin, 'updates_counters', False):
+        return
+    User.objects.filter(
+        id=instance.author_id, subscribers_count__gt=0
+    ).update(subscribers_count=F('subscribers_count') - 1)
+    User.objects.filter(
+        id=instance.subscriber_id, subscriptions_count__gt=0
+    ).update(subscriptions_count=F('subscriptions_count') - 1)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_token(sender, instance, created, **kwargs):
+    # Смена пароля, деактивация и любые другие правки пользователя
+    if not created:
+        invalidate_user_tokens(instance.id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)